@@ -1,13 +1,827 @@
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QLineEdit, QVBoxLayout, QWidget, QGridLayout, QHBoxLayout, QPlainTextEdit
-from PyQt6.QtGui import QFont
-from PyQt6.QtCore import Qt
+import os
+import time
+import argparse
+import csv
+import heapq
+import io
+import math
+import re
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from functools import lru_cache
+from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QLineEdit, QVBoxLayout, QWidget, QGridLayout, QHBoxLayout, QPlainTextEdit, QLabel, QStackedWidget, QFileDialog
+from PyQt6.QtGui import QFont, QPainter, QPainterPath, QPen, QColor
+from PyQt6.QtCore import Qt, QTimer, QPointF, QObject, QRunnable, QThreadPool, pyqtSignal
+import numpy as np
+
+# Движок выражений: текст дисплея разбирается один раз в байткод (постфиксная запись),
+# скомпилированные выражения хранятся в LRU-кэше по нормализованному тексту
+class ExpressionError(ValueError):
+    pass
+
+TOKEN_RE = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]+)|(<<|>>|[-+*/^()]))")
+
+# Бинарные операторы и их приоритет (как в Python: OR < XOR < AND < сдвиги < +- < */)
+BINARY_PRECEDENCE = {
+    'OR': 1, 'XOR': 2, 'AND': 3,
+    '<<': 4, '>>': 4,
+    '+': 5, '-': 5,
+    '*': 6, '/': 6,
+}
+UNARY_OPERATORS = {'-', '+', 'NOT'}
+FUNCTIONS = {'sin', 'cos', 'tan', 'log', 'sqrt'}
+
+
+def _as_int(value):
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ExpressionError(f"Битовая операция над нецелым числом: {value}")
+        return int(value)
+    return value
+
+
+# Целая степень и сдвиги считаются точно, пока результат помещается в MAX_RESULT_DIGITS цифр
+# (меньше предела преобразования int -> str в Python); больше - степень уходит во float
+# (переполнение -> ошибка), а сдвиг отклоняется. Иначе "9^9^9" подвешивает GUI на часы
+MAX_RESULT_DIGITS = 4000
+MAX_SHIFT = int(MAX_RESULT_DIGITS * math.log2(10))
+
+
+def _bounded_pow(a, b):
+    if isinstance(a, int) and isinstance(b, int) and b >= 0:
+        if abs(a) <= 1 or b * math.log10(abs(a)) <= MAX_RESULT_DIGITS:
+            return a ** b
+    return math.pow(a, b)
+
+
+def _bounded_shift(shift):
+    def apply(a, b):
+        b = _as_int(b)
+        if abs(b) > MAX_SHIFT:
+            raise ExpressionError("Слишком большой сдвиг")
+        return shift(_as_int(a), b)
+    return apply
+
+
+SCALAR_OPS = {
+    'unary': {
+        '-': lambda a: -a,
+        '+': lambda a: +a,
+        'NOT': lambda a: ~_as_int(a),
+    },
+    'binary': {
+        '+': lambda a, b: a + b,
+        '-': lambda a, b: a - b,
+        '*': lambda a, b: a * b,
+        '/': lambda a, b: a / b,
+        '^': _bounded_pow,
+        '<<': _bounded_shift(lambda a, b: a << b),
+        '>>': _bounded_shift(lambda a, b: a >> b),
+        'AND': lambda a, b: _as_int(a) & _as_int(b),
+        'OR': lambda a, b: _as_int(a) | _as_int(b),
+        'XOR': lambda a, b: _as_int(a) ^ _as_int(b),
+    },
+    'call': {
+        'sin': math.sin,
+        'cos': math.cos,
+        'tan': math.tan,
+        'log': math.log10,
+        'sqrt': math.sqrt,
+    },
+}
+
+
+def scan_tokens(text, pos=0):
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match:
+            raise ExpressionError(f"Неожиданный символ: {text[pos:].strip()[:1]!r}")
+        number, name, op = match.groups()
+        if number is not None:
+            value = float(number) if any(c in number for c in '.eE') else int(number)
+            token = ('num', value)
+        elif name is not None:
+            if name in FUNCTIONS or name in BINARY_PRECEDENCE or name in UNARY_OPERATORS:
+                token = ('op', name)
+            else:
+                # Свободная переменная (используется в пакетном режиме)
+                token = ('var', name)
+        else:
+            token = ('op', op)
+        pos = match.end()
+        yield token, pos
+
+
+def tokenize(text):
+    return [token for token, _ in scan_tokens(text)]
+
+
+class IncrementalTokenizer:
+    # Хранит токены предыдущего текста; при наборе сканируется только изменившийся хвост.
+    # Регулярка числа заглядывает до трёх символов за конец токена (экспонента "e+5"), поэтому
+    # пересканируются все токены, кончающиеся ближе трёх символов к месту правки:
+    # "12" + "3" должно дать 123, а "1e" + "5" - 1e5, а не [1, e, 5]
+    def __init__(self):
+        self.text = ""
+        self.tokens = []
+        self.ends = []
+
+    def tokenize(self, text):
+        common = 0
+        limit = min(len(text), len(self.text))
+        while common < limit and text[common] == self.text[common]:
+            common += 1
+        keep = bisect_left(self.ends, common - 2)
+        start = self.ends[keep - 1] if keep else 0
+        del self.tokens[keep:]
+        del self.ends[keep:]
+        try:
+            for token, end in scan_tokens(text, start):
+                self.tokens.append(token)
+                self.ends.append(end)
+        except ExpressionError:
+            self.text = ""
+            self.tokens = []
+            self.ends = []
+            raise
+        self.text = text
+        return self.tokens
+
+
+class Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.code = []
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def advance(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("Пустое выражение")
+        self.parse_binary(1)
+        if self.pos != len(self.tokens):
+            raise ExpressionError(f"Лишний токен: {self.peek()[1]}")
+        return tuple(self.code)
+
+    def parse_binary(self, min_precedence):
+        self.parse_unary()
+        while True:
+            kind, value = self.peek()
+            precedence = BINARY_PRECEDENCE.get(value) if kind == 'op' else None
+            if precedence is None or precedence < min_precedence:
+                return
+            self.advance()
+            self.parse_binary(precedence + 1)
+            self.code.append(('binary', value))
+
+    def parse_unary(self):
+        kind, value = self.peek()
+        if kind == 'op' and value in UNARY_OPERATORS:
+            self.advance()
+            self.parse_unary()
+            self.code.append(('unary', value))
+        elif kind == 'op' and value in FUNCTIONS:
+            # Функции допускают запись без скобок: "sin30", "sqrt-x" и т.п.
+            self.advance()
+            self.parse_unary()
+            self.code.append(('call', value))
+        else:
+            self.parse_power()
+
+    def parse_power(self):
+        self.parse_primary()
+        kind, value = self.peek()
+        if kind == 'op' and value == '^':
+            # Степень правоассоциативна и сильнее унарного минуса слева: -2^2 = -4
+            self.advance()
+            self.parse_unary()
+            self.code.append(('binary', '^'))
+
+    def parse_primary(self):
+        kind, value = self.advance()
+        if kind == 'num':
+            self.code.append(('const', value))
+        elif kind == 'var':
+            self.code.append(('var', value))
+        elif kind == 'op' and value == '(':
+            self.parse_binary(1)
+            if self.advance() != ('op', ')'):
+                raise ExpressionError("Не хватает закрывающей скобки")
+        elif kind is None:
+            raise ExpressionError("Неожиданный конец выражения")
+        else:
+            raise ExpressionError(f"Неожиданный токен: {value}")
+
+
+class CompiledExpression:
+    __slots__ = ('source', 'code', 'variables')
+
+    def __init__(self, source, code):
+        self.source = source
+        self.code = code
+        self.variables = tuple(dict.fromkeys(arg for opcode, arg in code if opcode == 'var'))
+
+    def evaluate(self, variables=None, ops=SCALAR_OPS):
+        unary, binary, call = ops['unary'], ops['binary'], ops['call']
+        stack = []
+        push, pop = stack.append, stack.pop
+        for opcode, arg in self.code:
+            if opcode == 'const':
+                push(arg)
+            elif opcode == 'var':
+                if not variables or arg not in variables:
+                    raise ExpressionError(f"Неизвестная переменная: {arg}")
+                push(variables[arg])
+            elif opcode == 'binary':
+                right = pop()
+                push(binary[arg](pop(), right))
+            elif opcode == 'unary':
+                push(unary[arg](pop()))
+            else:
+                push(call[arg](pop()))
+        return stack[0]
+
+
+def normalize_expression(text):
+    return " ".join(text.split())
+
+
+@lru_cache(maxsize=256)
+def _compile_normalized(text):
+    return CompiledExpression(text, Parser(tokenize(text)).parse())
+
+
+def compile_expression(text):
+    return _compile_normalized(normalize_expression(text))
+
+
+def evaluate_expression(text, variables=None):
+    return compile_expression(text).evaluate(variables)
+
+
+# Пакетный (headless) режим: то же выражение и тот же байткод, но операции над массивами NumPy.
+# QApplication для него не нужен.
+def _as_int_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        if not np.all(np.mod(values, 1) == 0):
+            raise ExpressionError("Битовая операция над нецелыми числами")
+        if np.any(np.abs(values) >= 2.0 ** 63):
+            raise ExpressionError("Битовая операция: число не помещается в int64")
+        return values.astype(np.int64)
+    return values
+
+
+# Сдвиги в int64 проверяются на переполнение: молча обрезанный результат ("1<<70" = 0)
+# расходился бы с точным результатом в GUI
+def _checked_shift(a, b, left):
+    a, b = _as_int_array(a), _as_int_array(b)
+    if np.any(b < 0):
+        raise ExpressionError("Отрицательный сдвиг")
+    if not left:
+        return np.right_shift(a, np.minimum(b, 63))
+    b = np.minimum(b, 64)
+    result = np.left_shift(a, np.minimum(b, 63))
+    if np.any((np.right_shift(result, np.minimum(b, 63)) != a) | ((b == 64) & (a != 0))):
+        raise ExpressionError("Переполнение int64 при сдвиге")
+    return result
+
+
+NUMPY_OPS = {
+    'unary': {
+        '-': np.negative,
+        '+': np.positive,
+        'NOT': lambda a: np.invert(_as_int_array(a)),
+    },
+    'binary': {
+        '+': np.add,
+        '-': np.subtract,
+        '*': np.multiply,
+        '/': np.true_divide,
+        '^': lambda a, b: np.power(np.asarray(a, dtype=np.float64), b),
+        '<<': lambda a, b: _checked_shift(a, b, left=True),
+        '>>': lambda a, b: _checked_shift(a, b, left=False),
+        'AND': lambda a, b: np.bitwise_and(_as_int_array(a), _as_int_array(b)),
+        'OR': lambda a, b: np.bitwise_or(_as_int_array(a), _as_int_array(b)),
+        'XOR': lambda a, b: np.bitwise_xor(_as_int_array(a), _as_int_array(b)),
+    },
+    'call': {
+        'sin': np.sin,
+        'cos': np.cos,
+        'tan': np.tan,
+        'log': np.log10,
+        'sqrt': np.sqrt,
+    },
+}
+
+
+def _batch_op(scalar, vector):
+    # Подвыражения из одних констант считаются так же, как в GUI (точные целые, ограниченная степень);
+    # ошибка в них превращается в NaN, и строка результата выводится как 'Error'
+    def apply(*args):
+        if any(isinstance(arg, np.ndarray) for arg in args):
+            return vector(*args)
+        try:
+            return scalar(*args)
+        except (ArithmeticError, ValueError):
+            return math.nan
+    return apply
+
+
+BATCH_OPS = {
+    kind: {name: _batch_op(SCALAR_OPS[kind][name], op) for name, op in ops.items()}
+    for kind, ops in NUMPY_OPS.items()
+}
+
+
+def evaluate_array(expression, **arrays):
+    compiled = compile_expression(expression)
+    missing = [name for name in compiled.variables if name not in arrays]
+    if missing:
+        raise ExpressionError(f"Не заданы переменные: {', '.join(missing)}")
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        result = compiled.evaluate({name: np.asarray(arrays[name]) for name in compiled.variables}, BATCH_OPS)
+    return np.asarray(result)
+
+
+def format_results(result, length):
+    # Константное выражение размножается на все строки; inf/NaN - то, что GUI показывает как 'Error'
+    values = np.broadcast_to(result, (length,)).tolist()
+    return ['Error' if isinstance(value, float) and not math.isfinite(value) else value for value in values]
+
+
+def iter_csv_chunks(path, columns, chunk_size=65536):
+    # Файл читается построчно, в памяти держится не больше chunk_size строк
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            raise ExpressionError("Пустой CSV: нет строки заголовка")
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ExpressionError(f"В CSV нет столбцов: {', '.join(missing)}")
+        indexes = [header.index(name) for name in columns]
+        rows = []
+        empty = True
+        for row in reader:
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield header, rows, _rows_to_columns(rows, columns, indexes)
+                rows = []
+                empty = False
+        # Даже без строк данных отдаём пустой блок, чтобы в выходной CSV попал заголовок
+        if rows or empty:
+            yield header, rows, _rows_to_columns(rows, columns, indexes)
+
+
+def _rows_to_columns(rows, columns, indexes):
+    return {name: np.array([row[index] for row in rows], dtype=np.float64) for name, index in zip(columns, indexes)}
+
+
+def evaluate_csv(expression, input_path, output_path=None, result_column='result', chunk_size=65536):
+    compiled = compile_expression(expression)
+    chunks = iter_csv_chunks(input_path, compiled.variables, chunk_size)
+    if output_path is None:
+        for _, rows, columns in chunks:
+            yield format_results(evaluate_array(expression, **columns), len(rows))
+        return
+    with open(output_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        header_written = False
+        for header, rows, columns in chunks:
+            if not header_written:
+                writer.writerow(header + [result_column])
+                header_written = True
+            values = format_results(evaluate_array(expression, **columns), len(rows))
+            writer.writerows(row + [value] for row, value in zip(rows, values))
+            yield values
+
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(
+        description="Пакетное вычисление выражения по столбцам CSV",
+        epilog="Значения столбцов читаются как числа с плавающей точкой, поэтому a^b со столбцами даёт float; "
+               "подвыражения из констант считаются точно, как в калькуляторе. "
+               "Строки, где результат не конечен (деление на ноль, переполнение), выводятся как Error.")
+    parser.add_argument('expression', help="выражение, переменные - имена столбцов, например: a*b+sqrt(c)")
+    parser.add_argument('input', help="входной CSV с заголовком")
+    parser.add_argument('-o', '--output', help="выходной CSV (по умолчанию результат печатается)")
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    args = parser.parse_args(argv)
+    try:
+        for result in evaluate_csv(args.expression, args.input, args.output, chunk_size=args.chunk_size):
+            if args.output is None:
+                for value in result:
+                    print(value)
+    except (ExpressionError, OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+# История вычислений: кольцевой буфер в памяти + журнал на диске, в который только дописываются строки.
+# Для поиска по префиксу выражения держим отсортированный индекс (выражение, номер записи)
+HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.neumorphism_calc_history')
+HISTORY_LIMIT = 1000
+
+
+class CalculationHistory:
+    def __init__(self, path=HISTORY_PATH, limit=HISTORY_LIMIT):
+        self.path = path
+        self.limit = limit
+        self.entries = deque()
+        self.index = []
+        self.next_seq = 0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return (f"{expression} = {result}" for _, expression, result in self.entries)
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        line_count = 0
+        tail = deque(maxlen=self.limit)
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                expression, sep, result = line.rstrip('\n').partition('\t')
+                if sep:
+                    tail.append((expression, result))
+                    line_count += 1
+        for expression, result in tail:
+            self._add(expression, result)
+        # Журнал растёт без ограничений - ужимаем его, когда он заметно больше буфера
+        if line_count > 2 * self.limit:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.writelines(f"{expression}\t{result}\n" for expression, result in tail)
+            os.replace(tmp_path, self.path)
+
+    def append(self, expression, result):
+        # Запись в памяти сохраняется, даже если журнал на диске недоступен (OSError уходит вызывающему)
+        expression = normalize_expression(expression)
+        self._add(expression, result)
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(f"{expression}\t{result}\n")
+        return f"{expression} = {result}"
+
+    def _add(self, expression, result):
+        if len(self.entries) >= self.limit:
+            old_seq, old_expression, _ = self.entries.popleft()
+            del self.index[bisect_left(self.index, (old_expression, old_seq))]
+        self.entries.append((self.next_seq, expression, result))
+        insort(self.index, (expression, self.next_seq))
+        self.next_seq += 1
+
+    def search(self, prefix, limit=50):
+        # Диапазон совпадений по префиксу находится бинарным поиском, затем берём самые свежие
+        prefix = normalize_expression(prefix)
+        start = bisect_left(self.index, (prefix,))
+        stop = bisect_left(self.index, (prefix + '\U0010ffff',))
+        matches = heapq.nlargest(limit, self.index[start:stop], key=lambda item: item[1])
+        first_seq = self.entries[0][0] if self.entries else 0
+        return [self.entries[seq - first_seq] for _, seq in matches]
+
+
+# Построитель графиков для научного режима. Выборки считаются векторно (evaluate_array) блоками
+# фиксированной длины на сетке с шагом 2**level; блоки кэшируются, поэтому при панорамировании
+# вычисляются только вновь открывшиеся участки, а при возврате масштаба - ничего
+PLOT_BUCKET_SAMPLES = 128
+PLOT_CACHE_BUCKETS = 512
+PLOT_REFINE_PASSES = 3
+PLOT_REFINE_TOLERANCE = 0.02
+PLOT_MIN_SPAN = 1e-9
+PLOT_MAX_SPAN = 1e12
+
+
+class PlotWidget(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.expression = None
+        self.error = ""
+        self.x_range = [-10.0, 10.0]
+        self.y_range = [-5.0, 5.0]
+        self.samples = OrderedDict()
+        self.drag_pos = None
+        self.setMinimumSize(400, 300)
+
+    def set_expression(self, text):
+        self.samples.clear()
+        self.error = ""
+        try:
+            self.expression = compile_expression(text)
+            unknown = [name for name in self.expression.variables if name != 'x']
+            if unknown:
+                raise ExpressionError(f"Неизвестная переменная: {unknown[0]}")
+            self.autoscale()
+        except Exception as e:
+            self.expression = None
+            self.error = str(e)
+        self.update()
+
+    def sample_level(self):
+        span = self.x_range[1] - self.x_range[0]
+        return math.ceil(math.log2(span / max(self.width(), 1)))
+
+    def evaluate(self, xs):
+        with np.errstate(all='ignore'):
+            ys = self.expression.evaluate({'x': xs}, NUMPY_OPS)
+            return np.broadcast_to(np.asarray(ys, dtype=np.float64), xs.shape)
+
+    def bucket(self, level, index):
+        key = (level, index)
+        if key in self.samples:
+            self.samples.move_to_end(key)
+            return self.samples[key]
+        step = 2.0 ** level
+        xs = (index * PLOT_BUCKET_SAMPLES + np.arange(PLOT_BUCKET_SAMPLES + 1)) * step
+        ys = self.evaluate(xs)
+        xs, ys = self.refine(xs, ys)
+        self.samples[key] = (xs, ys)
+        if len(self.samples) > PLOT_CACHE_BUCKETS:
+            self.samples.popitem(last=False)
+        return xs, ys
+
+    def refine(self, xs, ys):
+        # Дополнительные точки только там, где велика вторая разность (кривизна) или есть разрыв
+        for _ in range(PLOT_REFINE_PASSES):
+            finite = np.isfinite(ys)
+            if finite.any():
+                scale = max(np.ptp(ys[finite]), 1e-12)
+            else:
+                break
+            curvature = np.abs(ys[:-2] - 2 * ys[1:-1] + ys[2:])
+            flagged = ~(curvature <= PLOT_REFINE_TOLERANCE * scale)
+            segments = np.zeros(len(xs) - 1, dtype=bool)
+            segments[:-1] |= flagged
+            segments[1:] |= flagged
+            indexes = np.nonzero(segments)[0]
+            if not len(indexes):
+                break
+            mid_xs = (xs[indexes] + xs[indexes + 1]) / 2
+            xs = np.insert(xs, indexes + 1, mid_xs)
+            ys = np.insert(ys, indexes + 1, self.evaluate(mid_xs))
+        return xs, ys
+
+    def visible_samples(self):
+        level = self.sample_level()
+        bucket_width = PLOT_BUCKET_SAMPLES * 2.0 ** level
+        first = math.floor(self.x_range[0] / bucket_width)
+        last = math.floor(self.x_range[1] / bucket_width)
+        parts = [self.bucket(level, index) for index in range(first, last + 1)]
+        return np.concatenate([xs for xs, _ in parts]), np.concatenate([ys for _, ys in parts])
+
+    def autoscale(self):
+        _, ys = self.visible_samples()
+        ys = ys[np.isfinite(ys)]
+        if len(ys):
+            low, high = np.percentile(ys, [2, 98])
+            margin = max((high - low) * 0.1, 1e-9)
+            self.y_range = [low - margin, high + margin]
+
+    def to_screen(self, xs, ys):
+        width, height = self.width(), self.height()
+        sx = (xs - self.x_range[0]) / (self.x_range[1] - self.x_range[0]) * width
+        sy = height - (ys - self.y_range[0]) / (self.y_range[1] - self.y_range[0]) * height
+        return sx, sy
+
+    def build_path(self):
+        xs, ys = self.visible_samples()
+        sx, sy = self.to_screen(xs, ys)
+        height = self.height()
+        # Точки вне экрана по вертикали обрезаем, на разрывах (tan, log) начинаем новый подпуть
+        valid = np.isfinite(sy)
+        sy = np.clip(np.where(valid, sy, 0), -height, 2 * height)
+        jumps = np.zeros(len(sy), dtype=bool)
+        jumps[1:] = np.abs(np.diff(sy)) > height
+        path = QPainterPath()
+        pen_down = False
+        for x, y, ok, jump in zip(sx.tolist(), sy.tolist(), valid.tolist(), jumps.tolist()):
+            if not ok:
+                pen_down = False
+            elif pen_down and not jump:
+                path.lineTo(x, y)
+            else:
+                path.moveTo(x, y)
+                pen_down = True
+        return path
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('#f5deb3'))
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        zero_x, zero_y = self.to_screen(np.array([0.0]), np.array([0.0]))
+        painter.setPen(QPen(QColor('#aa2f00'), 1))
+        painter.drawLine(QPointF(0, zero_y[0]), QPointF(self.width(), zero_y[0]))
+        painter.drawLine(QPointF(zero_x[0], 0), QPointF(zero_x[0], self.height()))
+        if self.expression is not None:
+            painter.setPen(QPen(QColor('#FF4500'), 2))
+            painter.drawPath(self.build_path())
+        elif self.error:
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.error)
+        painter.end()
+
+    def mousePressEvent(self, event):
+        self.drag_pos = event.position()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_pos is None:
+            return
+        delta = event.position() - self.drag_pos
+        self.drag_pos = event.position()
+        dx = delta.x() * (self.x_range[1] - self.x_range[0]) / max(self.width(), 1)
+        dy = delta.y() * (self.y_range[1] - self.y_range[0]) / max(self.height(), 1)
+        self.x_range = [self.x_range[0] - dx, self.x_range[1] - dx]
+        self.y_range = [self.y_range[0] + dy, self.y_range[1] + dy]
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        self.drag_pos = None
+
+    def wheelEvent(self, event):
+        # Масштаб вокруг курсора
+        factor = 0.85 ** (event.angleDelta().y() / 120)
+        pos = event.position()
+        cx = self.x_range[0] + pos.x() / max(self.width(), 1) * (self.x_range[1] - self.x_range[0])
+        cy = self.y_range[1] - pos.y() / max(self.height(), 1) * (self.y_range[1] - self.y_range[0])
+        self.x_range = self.zoom_range(self.x_range, cx, factor)
+        self.y_range = self.zoom_range(self.y_range, cy, factor)
+        self.update()
+
+    @staticmethod
+    def zoom_range(bounds, center, factor):
+        # Ширина окна ограничена: при нулевой ширине шаг сетки (log2 ширины) не определён,
+        # а ближе PLOT_MIN_SPAN от |center| соседние точки сливаются в одно число float
+        span = bounds[1] - bounds[0]
+        min_span = max(PLOT_MIN_SPAN, abs(center) * PLOT_MIN_SPAN)
+        factor = min(max(factor, min_span / span), PLOT_MAX_SPAN / span)
+        return [center + (v - center) * factor for v in bounds]
+
+
+class PlotWindow(QWidget):
+    def __init__(self, expression="sin(x)"):
+        super().__init__()
+        self.setWindowTitle('Plot')
+        self.resize(600, 450)
+        layout = QVBoxLayout(self)
+        input_layout = QHBoxLayout()
+        self.expression_input = QLineEdit(expression)
+        self.expression_input.setFont(QFont('Arial', 14))
+        self.expression_input.returnPressed.connect(self.plot)
+        plot_button = QPushButton("Построить")
+        plot_button.clicked.connect(self.plot)
+        input_layout.addWidget(self.expression_input)
+        input_layout.addWidget(plot_button)
+        layout.addLayout(input_layout)
+        self.plot_widget = PlotWidget()
+        layout.addWidget(self.plot_widget)
+
+    def plot(self):
+        self.plot_widget.set_expression(self.expression_input.text())
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.plot()
+
+
+# Матричный и статистический режим: все операции - векторные вызовы NumPy.
+# Разбор ввода и вычисления выполняются в QThreadPool, чтобы матрицы 1000x1000 не подвешивали окно
+MATRIX_OPERATIONS = {
+    'A+B': lambda a, b, p: np.add(a, b),
+    'A-B': lambda a, b, p: np.subtract(a, b),
+    'A*B': lambda a, b, p: np.multiply(a, b),
+    'A/B': lambda a, b, p: np.true_divide(a, b),
+    'A@B': lambda a, b, p: np.matmul(a, b),
+    'inv': lambda a, b, p: np.linalg.inv(a),
+    'det': lambda a, b, p: np.linalg.det(a),
+    'T': lambda a, b, p: np.transpose(a),
+    'mean': lambda a, b, p: np.mean(a),
+    'std': lambda a, b, p: np.std(a),
+    'pct': lambda a, b, p: np.percentile(a, p),
+}
+MATRIX_BINARY_OPERATIONS = {'A+B', 'A-B', 'A*B', 'A/B', 'A@B'}
+
+MATRIX_BUTTONS = [
+    ('A+B', 0, 0), ('A-B', 0, 1), ('A*B', 0, 2), ('A/B', 0, 3),
+    ('A@B', 1, 0), ('inv', 1, 1), ('det', 1, 2), ('T', 1, 3),
+    ('mean', 2, 0), ('std', 2, 1), ('pct', 2, 2), ('C', 2, 3),
+]
+
+
+def parse_matrix(text):
+    # Строки - по строкам текста, значения разделяются пробелами, запятыми или точками с запятой
+    text = text.replace(',', ' ').replace(';', ' ').strip()
+    if not text:
+        raise ExpressionError("Пустая матрица")
+    return np.loadtxt(io.StringIO(text), dtype=np.float64, ndmin=1)
+
+
+def format_matrix_result(result):
+    if np.ndim(result) == 0:
+        return str(float(result))
+    return f"[{'×'.join(str(n) for n in np.shape(result))}]"
+
+
+class MatrixTaskSignals(QObject):
+    finished = pyqtSignal(int, str, object)
+    failed = pyqtSignal(int, str)
+
+
+class MatrixTask(QRunnable):
+    def __init__(self, job_id, operation, a, b, percentile):
+        super().__init__()
+        self.job_id = job_id
+        self.operation = operation
+        self.a = a
+        self.b = b
+        self.percentile = percentile
+        self.signals = MatrixTaskSignals()
+
+    def run(self):
+        try:
+            a = parse_matrix(self.a) if isinstance(self.a, str) else self.a
+            b = None
+            if self.operation in MATRIX_BINARY_OPERATIONS:
+                b = parse_matrix(self.b) if isinstance(self.b, str) else self.b
+            result = MATRIX_OPERATIONS[self.operation](a, b, self.percentile)
+            self.signals.finished.emit(self.job_id, self.operation, result)
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+
+
+class MatrixImportTask(QRunnable):
+    def __init__(self, job_id, name, path):
+        super().__init__()
+        self.job_id = job_id
+        self.name = name
+        self.path = path
+        self.signals = MatrixTaskSignals()
+
+    def run(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.signals.finished.emit(self.job_id, self.name, parse_matrix(file.read()))
+        except Exception as e:
+            self.signals.failed.emit(self.job_id, str(e))
+
+
+# Раскладки клавиатуры для каждого режима: (текст, строка, столбец)
+BASIC_BUTTONS = [
+    ('MC', 0, 0), ('MR', 0, 1), ('M+', 0, 2), ('M-', 0, 3),
+    ('C', 1, 0), ('DEL', 1, 1), ('(', 1, 2), (')', 1, 3),
+    ('7', 2, 0), ('8', 2, 1), ('9', 2, 2), ('/', 2, 3),
+    ('4', 3, 0), ('5', 3, 1), ('6', 3, 2), ('*', 3, 3),
+    ('1', 4, 0), ('2', 4, 1), ('3', 4, 2), ('-', 4, 3),
+    ('0', 5, 0), ('.', 5, 1), ('=', 5, 2), ('+', 5, 3),
+]
+
+SCIENTIFIC_BUTTONS = [
+    ('MC', 0, 0), ('MR', 0, 1), ('M+', 0, 2), ('M-', 0, 3),
+    ('sin', 1, 0), ('cos', 1, 1), ('tan', 1, 2), ('log', 1, 3),
+    ('sqrt', 2, 0), ('^', 2, 1), ('(', 2, 2), (')', 2, 3),
+    ('7', 3, 0), ('8', 3, 1), ('9', 3, 2), ('/', 3, 3),
+    ('4', 4, 0), ('5', 4, 1), ('6', 4, 2), ('*', 4, 3),
+    ('1', 5, 0), ('2', 5, 1), ('3', 5, 2), ('-', 5, 3),
+    ('0', 6, 0), ('.', 6, 1), ('=', 6, 2), ('+', 6, 3),
+]
+
+PROGRAMMER_BUTTONS = [
+    ('MC', 0, 0), ('MR', 0, 1), ('M+', 0, 2), ('M-', 0, 3),
+    ('AND', 1, 0), ('OR', 1, 1), ('XOR', 1, 2), ('NOT', 1, 3),
+    ('<<', 2, 0), ('>>', 2, 1), ('(', 2, 2), (')', 2, 3),
+    ('7', 3, 0), ('8', 3, 1), ('9', 3, 2), ('/', 3, 3),
+    ('4', 4, 0), ('5', 4, 1), ('6', 4, 2), ('*', 4, 3),
+    ('1', 5, 0), ('2', 5, 1), ('3', 5, 2), ('-', 5, 3),
+    ('0', 6, 0), ('.', 6, 1), ('=', 6, 2), ('+', 6, 3),
+]
+
+OPERATION_BUTTONS = {'/', '*', '-', '+', '=', '^', 'sin', 'cos', 'tan', 'log', 'sqrt', 'AND', 'OR', 'XOR', 'NOT', '<<', '>>'}
+FUNCTION_BUTTONS = {'C', 'DEL', '(', ')', 'MC', 'MR', 'M+', 'M-'}
+
 
 class Calculator(QMainWindow):
     def __init__(self):
         super().__init__()
         self.memory = 0  # Добавляем переменную для хранения памяти
-        self.history = []  # Добавляем список для хранения истории вычислений
+        self.history = CalculationHistory()  # История вычислений (загружается после показа окна)
         self.initUI()
 
     def initUI(self):
@@ -27,6 +841,20 @@ class Calculator(QMainWindow):
         self.display.setStyleSheet(self.display_style())
         vbox.addWidget(self.display)
 
+        # Строка предпросмотра результата, обновляется с задержкой после каждого нажатия
+        self.preview = QLabel()
+        self.preview.setAlignment(Qt.AlignmentFlag.AlignRight)
+        self.preview.setFont(QFont('Arial', 12))
+        self.preview.setStyleSheet("color: #aa2f00; padding-right: 15px;")
+        vbox.addWidget(self.preview)
+
+        self.preview_tokenizer = IncrementalTokenizer()
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(120)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.display.textChanged.connect(self.preview_timer.start)
+
         mode_layout = QHBoxLayout()
         self.basic_btn = QPushButton("Basic")
         self.basic_btn.setFont(QFont('Arial', 12))
@@ -43,22 +871,53 @@ class Calculator(QMainWindow):
         self.prog_btn.clicked.connect(self.show_programmer)
         self.prog_btn.setStyleSheet(self.mode_button_style())
 
+        # Кнопка графиков видна только в научном режиме
+        self.plot_btn = QPushButton("f(x)")
+        self.plot_btn.setFont(QFont('Arial', 12))
+        self.plot_btn.clicked.connect(self.show_plot)
+        self.plot_btn.setStyleSheet(self.mode_button_style())
+        self.plot_window = None
+
         mode_layout.addWidget(self.basic_btn)
         mode_layout.addWidget(self.sci_btn)
+        self.matrix_btn = QPushButton("Matrix")
+        self.matrix_btn.setFont(QFont('Arial', 12))
+        self.matrix_btn.clicked.connect(self.show_matrix)
+        self.matrix_btn.setStyleSheet(self.mode_button_style())
+
         mode_layout.addWidget(self.prog_btn)
+        mode_layout.addWidget(self.matrix_btn)
+        mode_layout.addWidget(self.plot_btn)
         vbox.addLayout(mode_layout)
 
-        self.grid = QGridLayout()
-        vbox.addLayout(self.grid)
+        # Все три клавиатуры строятся один раз, переключение режима - смена страницы
+        self.pages = QStackedWidget()
+        self.pages.setStyleSheet(self.keypad_style())
+        self.basic_page = self.create_page(BASIC_BUTTONS)
+        self.scientific_page = self.create_page(SCIENTIFIC_BUTTONS)
+        self.programmer_page = self.create_page(PROGRAMMER_BUTTONS)
+        self.matrix_page = self.create_matrix_page()
+        vbox.addWidget(self.pages)
+
+        # Поиск по истории: показывает выражения с введённым префиксом, Enter подставляет последнее
+        self.history_search = QLineEdit()
+        self.history_search.setPlaceholderText("Поиск в истории")
+        self.history_search.setFont(QFont('Arial', 12))
+        self.history_search.setStyleSheet("QLineEdit { font-size: 12px; padding: 5px; border-radius: 10px; background: #f5deb3; }")
+        self.history_search.textChanged.connect(self.search_history)
+        self.history_search.returnPressed.connect(self.recall_history)
+        vbox.addWidget(self.history_search)
 
         self.history_display = QPlainTextEdit()
         self.history_display.setReadOnly(True)
         self.history_display.setFont(QFont('Arial', 12))
         self.history_display.setStyleSheet(self.display_style())
+        self.history_display.setMaximumBlockCount(self.history.limit)
         vbox.addWidget(self.history_display)
 
         self.central_widget.setLayout(vbox)
         self.show_basic()
+        QTimer.singleShot(0, self.load_history)
 
     def mode_button_style(self):
         return """
@@ -154,62 +1013,178 @@ class Calculator(QMainWindow):
         }
         """
 
+    def keypad_style(self):
+        # Один общий стиль для всех клавиатур: вид кнопки выбирается динамическим свойством "role"
+        return (self.neumorphism_style().replace('QPushButton', 'QPushButton[role="digit"]')
+                + self.operation_button_style().replace('QPushButton', 'QPushButton[role="operation"]')
+                + self.function_button_style().replace('QPushButton', 'QPushButton[role="function"]'))
+
     def show_basic(self):
-        self.clear_layout(self.grid)
-        buttons = [
-            ('MC', 0, 0), ('MR', 0, 1), ('M+', 0, 2), ('M-', 0, 3),
-            ('C', 1, 0), ('DEL', 1, 1), ('(', 1, 2), (')', 1, 3),
-            ('7', 2, 0), ('8', 2, 1), ('9', 2, 2), ('/', 2, 3),
-            ('4', 3, 0), ('5', 3, 1), ('6', 3, 2), ('*', 3, 3),
-            ('1', 4, 0), ('2', 4, 1), ('3', 4, 2), ('-', 4, 3),
-            ('0', 5, 0), ('.', 5, 1), ('=', 5, 2), ('+', 5, 3),
-        ]
-        self.create_buttons(buttons)
+        self.pages.setCurrentWidget(self.basic_page)
+        self.plot_btn.hide()
 
     def show_scientific(self):
-        self.clear_layout(self.grid)
-        buttons = [
-            ('MC', 0, 0), ('MR', 0, 1), ('M+', 0, 2), ('M-', 0, 3),
-            ('sin', 1, 0), ('cos', 1, 1), ('tan', 1, 2), ('log', 1, 3),
-            ('sqrt', 2, 0), ('^', 2, 1), ('(', 2, 2), (')', 2, 3),
-            ('7', 3, 0), ('8', 3, 1), ('9', 3, 2), ('/', 3, 3),
-            ('4', 4, 0), ('5', 4, 1), ('6', 4, 2), ('*', 4, 3),
-            ('1', 5, 0), ('2', 5, 1), ('3', 5, 2), ('-', 5, 3),
-            ('0', 6, 0), ('.', 6, 1), ('=', 6, 2), ('+', 6, 3),
-        ]
-        self.create_buttons(buttons)
+        self.pages.setCurrentWidget(self.scientific_page)
+        self.plot_btn.show()
 
     def show_programmer(self):
-        self.clear_layout(self.grid)
-        buttons = [
-            ('MC', 0, 0), ('MR', 0, 1), ('M+', 0, 2), ('M-', 0, 3),
-            ('AND', 1, 0), ('OR', 1, 1), ('XOR', 1, 2), ('NOT', 1, 3),
-            ('<<', 2, 0), ('>>', 2, 1), ('(', 2, 2), (')', 2, 3),
-            ('7', 3, 0), ('8', 3, 1), ('9', 3, 2), ('/', 3, 3),
-            ('4', 4, 0), ('5', 4, 1), ('6', 4, 2), ('*', 4, 3),
-            ('1', 5, 0), ('2', 5, 1), ('3', 5, 2), ('-', 5, 3),
-            ('0', 6, 0), ('.', 6, 1), ('=', 6, 2), ('+', 6, 3),
-        ]
-        self.create_buttons(buttons)
-
-    def create_buttons(self, buttons):
+        self.pages.setCurrentWidget(self.programmer_page)
+        self.plot_btn.hide()
+
+    def show_matrix(self):
+        self.pages.setCurrentWidget(self.matrix_page)
+        self.plot_btn.hide()
+
+    def create_matrix_page(self):
+        page = QWidget()
+        layout = QVBoxLayout(page)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.matrix_inputs = {}
+        self.matrix_imported = {}
+        for name in ('A', 'B'):
+            row = QHBoxLayout()
+            label = QLabel(name)
+            label.setFont(QFont('Arial', 12))
+            import_button = QPushButton("Импорт")
+            import_button.setProperty('role', 'function')
+            import_button.clicked.connect(lambda checked=False, name=name: self.import_matrix(name))
+            row.addWidget(label)
+            row.addStretch()
+            row.addWidget(import_button)
+            layout.addLayout(row)
+            matrix_input = QPlainTextEdit()
+            matrix_input.setPlaceholderText("1 2; 3 4 - строки с новой строки")
+            matrix_input.setStyleSheet(self.display_style())
+            matrix_input.textChanged.connect(lambda name=name: self.matrix_imported.pop(name, None))
+            layout.addWidget(matrix_input)
+            self.matrix_inputs[name] = matrix_input
+            self.matrix_imported[name] = None
+
+        self.percentile_input = QLineEdit("50")
+        self.percentile_input.setPlaceholderText("Перцентиль, %")
+        layout.addWidget(self.percentile_input)
+
+        grid = QGridLayout()
+        self.matrix_buttons = []
+        for btn_text, row, col in MATRIX_BUTTONS:
+            button = QPushButton(btn_text)
+            button.setFont(QFont('Arial', 14))
+            button.setProperty('role', 'function' if btn_text == 'C' else 'operation')
+            button.clicked.connect(self.on_matrix_click)
+            grid.addWidget(button, row, col)
+            self.matrix_buttons.append(button)
+        layout.addLayout(grid)
+
+        self.matrix_result = QPlainTextEdit()
+        self.matrix_result.setReadOnly(True)
+        self.matrix_result.setStyleSheet(self.display_style())
+        layout.addWidget(self.matrix_result)
+
+        self.matrix_job_id = 0
+        # Импорты нумеруются отдельно от вычислений: последний номер для каждой матрицы
+        self.matrix_import_job_id = 0
+        self.matrix_import_ids = {}
+        self.matrix_tasks = set()
+        self.pages.addWidget(page)
+        return page
+
+    def matrix_operand(self, name):
+        imported = self.matrix_imported.get(name)
+        if imported is not None:
+            return imported
+        return self.matrix_inputs[name].toPlainText()
+
+    def on_matrix_click(self):
+        operation = self.sender().text()
+        if operation == 'C':
+            for matrix_input in self.matrix_inputs.values():
+                matrix_input.clear()
+            self.matrix_result.clear()
+            self.display.clear()
+            return
+        try:
+            percentile = float(self.percentile_input.text() or 50)
+        except ValueError:
+            self.display.setText('Error')
+            return
+        # Более ранние незавершённые задания просто игнорируются по номеру
+        self.matrix_job_id += 1
+        task = MatrixTask(self.matrix_job_id, operation, self.matrix_operand('A'), self.matrix_operand('B'), percentile)
+        self.start_matrix_task(task, self.on_matrix_result, self.on_matrix_error)
+        self.display.setText('...')
+
+    def start_matrix_task(self, task, on_finished, on_failed):
+        # Держим ссылку на сигналы до завершения задачи, иначе их удалит сборщик мусора
+        self.matrix_tasks.add(task.signals)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(on_failed)
+        task.signals.finished.connect(lambda *args, signals=task.signals: self.matrix_tasks.discard(signals))
+        task.signals.failed.connect(lambda *args, signals=task.signals: self.matrix_tasks.discard(signals))
+        QThreadPool.globalInstance().start(task)
+
+    def on_matrix_result(self, job_id, operation, result):
+        if job_id != self.matrix_job_id:
+            return
+        summary = format_matrix_result(result)
+        self.display.setText(summary)
+        self.matrix_result.setPlainText(np.array2string(np.asarray(result), threshold=200, precision=6))
+        try:
+            self.update_history(self.history.append(operation, summary))
+        except OSError as e:
+            self.update_history(f"{operation} = {summary}")
+            self.preview.setText(f"История не сохранена: {e}")
+
+    def on_matrix_error(self, job_id, message):
+        if job_id == self.matrix_job_id:
+            self.display.setText('Error')
+            self.matrix_result.setPlainText(message)
+
+    def import_matrix(self, name):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Импорт матрицы", "", "CSV/Text (*.csv *.txt);;All files (*)")
+        if file_path:
+            self.matrix_import_job_id += 1
+            self.matrix_import_ids[name] = self.matrix_import_job_id
+            task = MatrixImportTask(self.matrix_import_job_id, name, file_path)
+            self.start_matrix_task(task, self.on_matrix_imported, self.on_matrix_import_failed)
+
+    def on_matrix_imported(self, job_id, name, matrix):
+        if job_id != self.matrix_import_ids.get(name):
+            return
+        matrix_input = self.matrix_inputs[name]
+        matrix_input.blockSignals(True)
+        matrix_input.setPlainText(f"<импортировано: {format_matrix_result(matrix)}>")
+        matrix_input.blockSignals(False)
+        self.matrix_imported[name] = matrix
+
+    def on_matrix_import_failed(self, job_id, message):
+        if job_id in self.matrix_import_ids.values():
+            self.display.setText('Error')
+            self.matrix_result.setPlainText(message)
+
+    def show_plot(self):
+        if self.plot_window is None:
+            self.plot_window = PlotWindow()
+        self.plot_window.show()
+        self.plot_window.raise_()
+
+    def create_page(self, buttons):
+        page = QWidget()
+        grid = QGridLayout(page)
+        grid.setContentsMargins(0, 0, 0, 0)
+        font = QFont('Arial', 18)
         for btn_text, row, col in buttons:
             button = QPushButton(btn_text)
-            button.setFont(QFont('Arial', 18))
-            if btn_text in {'/', '*', '-', '+', '=', '^', 'sin', 'cos', 'tan', 'log', 'sqrt', 'AND', 'OR', 'XOR', 'NOT', '<<', '>>'}:
-                button.setStyleSheet(self.operation_button_style())
-            elif btn_text in {'C', 'DEL', '(', ')', 'MC', 'MR', 'M+', 'M-'}:
-                button.setStyleSheet(self.function_button_style())
+            button.setFont(font)
+            if btn_text in OPERATION_BUTTONS:
+                button.setProperty('role', 'operation')
+            elif btn_text in FUNCTION_BUTTONS:
+                button.setProperty('role', 'function')
             else:
-                button.setStyleSheet(self.neumorphism_style())
+                button.setProperty('role', 'digit')
             button.clicked.connect(self.on_click)
-            self.grid.addWidget(button, row, col)
-
-    def clear_layout(self, layout):
-        while layout.count():
-            child = layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+            grid.addWidget(button, row, col)
+        self.pages.addWidget(page)
+        return page
 
     def on_click(self):
         sender = self.sender()
@@ -221,34 +1196,102 @@ class Calculator(QMainWindow):
             current_text = self.display.text()
             self.display.setText(current_text[:-1])
         elif btn_text == '=':
+            expression = self.display.text()
             try:
-                result = str(eval(self.display.text()))
-                self.history.append(self.display.text() + " = " + result)
-                self.update_history()
-                self.display.setText(result)
+                result = str(evaluate_expression(expression))
             except Exception as e:
                 self.display.setText('Error')
+                return
+            self.display.setText(result)
+            try:
+                self.update_history(self.history.append(expression, result))
+            except OSError as e:
+                self.update_history(f"{normalize_expression(expression)} = {result}")
+                self.preview.setText(f"История не сохранена: {e}")
         elif btn_text == 'MC':
             self.memory = 0
         elif btn_text == 'MR':
             self.display.setText(self.display.text() + str(self.memory))
         elif btn_text == 'M+':
             try:
-                self.memory += eval(self.display.text())
+                self.memory += evaluate_expression(self.display.text())
             except Exception as e:
                 pass
         elif btn_text == 'M-':
             try:
-                self.memory -= eval(self.display.text())
+                self.memory -= evaluate_expression(self.display.text())
             except Exception as e:
                 pass
         else:
             self.display.setText(self.display.text() + btn_text)
 
-    def update_history(self):
+    def update_preview(self):
+        text = self.display.text()
+        try:
+            # Инкрементально только сканирование; разбор токенов каждый раз полный (он линейный и дешёвый)
+            tokens = self.preview_tokenizer.tokenize(text)
+            code = Parser(tokens).parse()
+            if len(code) < 2:
+                self.preview.clear()
+                return
+            self.preview.setText("= " + str(CompiledExpression(text, code).evaluate()))
+        except Exception:
+            # Незаконченное выражение ("2+", "sin(") - просто не показываем результат
+            self.preview.clear()
+
+    def load_history(self):
+        self.history.load()
         self.history_display.setPlainText("\n".join(self.history))
 
+    def update_history(self, line):
+        # Добавляем только новую строку; пока идёт поиск, список совпадений не трогаем
+        if not self.history_search.text():
+            self.history_display.appendPlainText(line)
+
+    def search_history(self, prefix):
+        if prefix:
+            lines = (f"{expression} = {result}" for _, expression, result in self.history.search(prefix))
+        else:
+            lines = self.history
+        self.history_display.setPlainText("\n".join(lines))
+
+    def recall_history(self):
+        # Записи матричных операций ("A@B = [2×2]") не выражения - в строку ввода их не подставляем
+        for _, expression, _ in self.history.search(self.history_search.text(), limit=self.history.limit):
+            if expression not in MATRIX_OPERATIONS:
+                self.display.setText(expression)
+                return
+
+
+def benchmark_mode_switch(calc, rounds=200):
+    # Замер задержки переключения режимов (вызов show_* + обработка событий отрисовки)
+    app = QApplication.instance()
+    for name in ('show_basic', 'show_scientific', 'show_programmer'):
+        switch = getattr(calc, name)
+        timings = []
+        for _ in range(rounds):
+            if name == 'show_basic':
+                calc.show_programmer()
+            else:
+                calc.show_basic()
+            app.processEvents()
+            started = time.perf_counter()
+            switch()
+            app.processEvents()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{name}: median {timings[len(timings) // 2]:.3f} ms, p95 {timings[int(len(timings) * 0.95)]:.3f} ms")
+
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench-modes':
+        app = QApplication(sys.argv)
+        calc = Calculator()
+        calc.show()
+        benchmark_mode_switch(calc)
+        sys.exit(0)
     app = QApplication(sys.argv)
     calc = Calculator()
     calc.show()
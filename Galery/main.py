@@ -1,30 +1,1029 @@
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QLabel, QWidget, QScrollArea, QFileDialog, QPushButton, QHBoxLayout, QGraphicsBlurEffect, QMenu, QListWidget, QListWidgetItem
-from PyQt6.QtGui import QPixmap, QIcon
-from PyQt6.QtCore import QSize, Qt, QUrl
-from PyQt6.QtMultimedia import QMediaPlayer
+import os
+import hashlib
+import math
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QLabel, QWidget, QFileDialog, QPushButton, QHBoxLayout, QGraphicsBlurEffect, QMenu, QListView, QStyledItemDelegate, QStyle, QProgressBar, QSizePolicy, QDialog, QTreeWidget, QTreeWidgetItem, QComboBox
+from PyQt6.QtGui import QPixmap, QAction, QImage, QImageReader, QImageIOHandler, QColor, QPainter
+from PyQt6.QtCore import QSize, Qt, QUrl, QObject, QRunnable, QThreadPool, QTimer, QEvent, QRect, QRectF, QPoint, QPointF, QModelIndex, QAbstractListModel, QItemSelection, QItemSelectionModel, pyqtSignal
+from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput, QVideoSink
 from PyQt6.QtMultimediaWidgets import QVideoWidget
+import numpy as np
+
+# Миниатюры: декодируется сразу уменьшенное изображение (QImageReader.setScaledSize), в пуле потоков,
+# и кладётся в постоянный кэш по схеме freedesktop (~/.cache/thumbnails/normal/<md5(uri)>.png)
+THUMBNAIL_SIZE = 128
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv')
+CACHE_HOME = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+DATA_HOME = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+THUMBNAIL_DIR = os.path.join(CACHE_HOME, 'thumbnails', 'normal')
+
+
+class ThumbnailCache:
+    def __init__(self, directory=THUMBNAIL_DIR):
+        self.directory = directory
+
+    def uri(self, path):
+        return Path(os.path.abspath(path)).as_uri()
+
+    def thumbnail_path(self, path):
+        return os.path.join(self.directory, hashlib.md5(self.uri(path).encode('utf-8')).hexdigest() + '.png')
+
+    def load(self, path, stat):
+        # Миниатюра годится, только если совпадают время изменения и размер исходного файла
+        # (QImageReader.text() неверно разбирает ключи вида "Thumb::MTime", поэтому читаем через QImage)
+        image = QImage(self.thumbnail_path(path))
+        if image.isNull():
+            return None
+        if image.text('Thumb::MTime') != str(int(stat.st_mtime)) or image.text('Thumb::Size') != str(stat.st_size):
+            return None
+        return image
+
+    def store(self, path, stat, image, original_size=None):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        image.setText('Thumb::URI', self.uri(path))
+        image.setText('Thumb::MTime', str(int(stat.st_mtime)))
+        image.setText('Thumb::Size', str(stat.st_size))
+        if original_size is not None and original_size.isValid():
+            image.setText('Thumb::Image::Width', str(original_size.width()))
+            image.setText('Thumb::Image::Height', str(original_size.height()))
+        image.setText('Software', 'Galery')
+        save_image_atomic(image, self.thumbnail_path(path))
+
+
+def save_image_atomic(image, path, format='PNG'):
+    # Через временный файл: читатель в другом потоке никогда не увидит недописанную картинку
+    fd, tmp_path = tempfile.mkstemp(suffix='.' + format.lower(), dir=os.path.dirname(path))
+    os.close(fd)
+    if image.save(tmp_path, format):
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+
+
+def decode_scaled(path, size, auto_transform=True):
+    # Возвращает уменьшенное изображение и размер оригинала (он читается из заголовка файла)
+    reader = QImageReader(path)
+    reader.setAutoTransform(auto_transform)
+    original = reader.size()
+    if original.isValid() and (original.width() > size or original.height() > size):
+        reader.setScaledSize(original.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio))
+    return reader.read(), original
+
+
+class ThumbnailSignals(QObject):
+    ready = pyqtSignal(str, QImage, object)
+    done = pyqtSignal(str)
+    missing = pyqtSignal(str, object)
+    failed = pyqtSignal(str, object)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, path, cache, signals, cancelled=None, frame=None, describe=False):
+        super().__init__()
+        self.path = path
+        self.cache = cache
+        self.signals = signals
+        self.cancelled = cancelled
+        self.frame = frame
+        self.describe = describe
+
+    def run(self):
+        deferred = False
+        try:
+            if self.cancelled is None or not self.cancelled.is_set():
+                deferred = self.make_thumbnail()
+        finally:
+            if not deferred:
+                self.signals.done.emit(self.path)
+
+    def make_thumbnail(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        try:
+            return self.build(stat)
+        except Exception:
+            # Исключение из QRunnable.run в PyQt6 завершает процесс: один испорченный файл не должен ронять галерею
+            self.report_failure(stat)
+
+    def report_failure(self, stat):
+        # Нераскодированный файл тоже попадает в каталог (без размеров), иначе после перезапуска
+        # он пропал бы из сетки, а каждая сверка с диском импортировала бы его заново
+        if self.describe:
+            self.signals.failed.emit(self.path, {'size': stat.st_size, 'mtime': stat.st_mtime, 'width': 0, 'height': 0})
+
+    def build(self, stat):
+        image = self.cache.load(self.path, stat) if self.frame is None else None
+        if image is None:
+            if self.frame is not None and self.frame.isNull():
+                image = self.frame
+            elif self.frame is not None:
+                original = self.frame.size()
+                image = self.frame.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+            elif self.path.lower().endswith(VIDEO_EXTENSIONS):
+                # Кадр из видео достаёт VideoThumbnailer, он же потом пошлёт done
+                self.signals.missing.emit(self.path, self.cancelled)
+                return True
+            else:
+                image, original = decode_scaled(self.path, THUMBNAIL_SIZE)
+            if image.isNull():
+                self.report_failure(stat)
+                return
+            try:
+                self.cache.store(self.path, stat, image, original)
+            except OSError:
+                pass
+        metadata = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'width': int(image.text('Thumb::Image::Width') or 0),
+            'height': int(image.text('Thumb::Image::Height') or 0),
+        }
+        if self.frame is None and not self.path.lower().endswith(VIDEO_EXTENSIONS):
+            metadata['dhash'] = dhash(image)
+        if self.describe:
+            # Для каталога: дата съёмки и ориентация из EXIF, ключ миниатюры в дисковом кэше
+            metadata['taken'], metadata['orientation'] = read_exif(self.path)
+            metadata['thumbnail'] = os.path.splitext(os.path.basename(self.cache.thumbnail_path(self.path)))[0]
+        self.signals.ready.emit(self.path, image, metadata)
+
+
+# Кадры-превью видео: QMediaPlayer декодирует в своих потоках и отдаёт кадр через QVideoSink.
+# Одновременно работают не больше VIDEO_DECODERS плееров, остальные видео ждут в очереди;
+# готовый кадр уменьшается и сохраняется в тот же кэш миниатюр, что и для фото
+VIDEO_DECODERS = int(os.environ.get('GALERY_VIDEO_DECODERS', '2'))
+VIDEO_THUMBNAIL_OFFSET_MS = 1000
+VIDEO_THUMBNAIL_TIMEOUT_MS = 10000
+
+
+class VideoFrameGrabber(QObject):
+    grabbed = pyqtSignal(str, QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.offset = 0
+        self.fallback = None
+        self.player = QMediaPlayer(self)
+        self.sink = QVideoSink(self)
+        self.player.setVideoSink(self.sink)
+        self.sink.videoFrameChanged.connect(self.on_frame)
+        self.player.mediaStatusChanged.connect(self.on_status)
+        self.player.errorOccurred.connect(lambda *args: self.finish(None))
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(VIDEO_THUMBNAIL_TIMEOUT_MS)
+        self.timer.timeout.connect(lambda: self.finish(self.fallback))
+
+    def grab(self, path):
+        self.path = path
+        self.offset = 0
+        self.fallback = None
+        self.timer.start()
+        self.player.setSource(QUrl.fromLocalFile(path))
+
+    def on_status(self, status):
+        if self.path is None:
+            return
+        if status == QMediaPlayer.MediaStatus.LoadedMedia:
+            # Первая секунда часто чёрная, поэтому кадр берётся чуть дальше, но не позже середины
+            duration = self.player.duration()
+            self.offset = min(VIDEO_THUMBNAIL_OFFSET_MS, duration // 2) if duration > 0 else 0
+            if self.offset:
+                self.player.setPosition(self.offset)
+            self.player.play()
+        elif status in (QMediaPlayer.MediaStatus.EndOfMedia, QMediaPlayer.MediaStatus.InvalidMedia):
+            self.finish(self.fallback)
+
+    def on_frame(self, frame):
+        if self.path is None or not frame.isValid():
+            return
+        # Кадры до завершения перемотки пропускаем, но последний держим про запас для коротких видео
+        if frame.startTime() >= 0 and frame.startTime() // 1000 < self.offset:
+            self.fallback = frame
+            return
+        self.finish(frame)
+
+    def finish(self, frame):
+        if self.path is None:
+            return
+        path, self.path = self.path, None
+        self.fallback = None
+        self.timer.stop()
+        image = frame.toImage() if frame is not None else QImage()
+        self.player.stop()
+        self.player.setSource(QUrl())
+        self.grabbed.emit(path, image)
+
+
+class VideoThumbnailer(QObject):
+    def __init__(self, cache, signals, decoders=VIDEO_DECODERS, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.signals = signals
+        self.decoders = max(1, decoders)
+        self.grabbers = []
+        self.idle = []
+        self.queue = deque()
+        self.queued = {}
+        self.active = set()
+
+    def request(self, path, cancelled=None, urgent=False):
+        if path in self.active:
+            return
+        if path in self.queued:
+            # Решение об отмене принимает последний запрос: видео, вернувшееся в окно, снова нужно
+            self.queued[path] = cancelled
+            if urgent:
+                self.queue.remove(path)
+                self.queue.appendleft(path)
+            return
+        self.queued[path] = cancelled
+        if urgent:
+            self.queue.appendleft(path)
+        else:
+            self.queue.append(path)
+        self.start_next()
+
+    def start_next(self):
+        while self.queue:
+            if not self.idle:
+                if len(self.grabbers) >= self.decoders:
+                    return
+                grabber = VideoFrameGrabber(self)
+                grabber.grabbed.connect(lambda path, image, grabber=grabber: self.on_grabbed(grabber, path, image))
+                self.grabbers.append(grabber)
+                self.idle.append(grabber)
+            path = self.queue.popleft()
+            cancelled = self.queued.pop(path)
+            if cancelled is not None and cancelled.is_set():
+                self.signals.done.emit(path)
+                continue
+            self.active.add(path)
+            self.idle.pop().grab(path)
+
+    def on_grabbed(self, grabber, path, image):
+        self.active.discard(path)
+        self.idle.append(grabber)
+        # Уменьшение кадра и запись PNG - в пуле потоков, как и для фото; пустой кадр задача
+        # отметит в каталоге как нераскодированное видео
+        QThreadPool.globalInstance().start(ThumbnailTask(path, self.cache, self.signals, frame=image, describe=True))
+        self.start_next()
+
+
+# Поиск похожих фото: 64-битный dHash по уже готовой миниатюре (знак разности соседних пикселей
+# в сером изображении 9x8). Хэши хранятся в SQLite, а для поиска строится мульти-индекс:
+# хэш режется на HASH_CHUNKS кусков по 16 бит, и у хэшей на расстоянии Хэмминга <= d хотя бы один
+# кусок отличается не больше чем на d // HASH_CHUNKS бит. Для каждого куска держится отсортированный
+# массив, кандидаты ищутся двоичным поиском по соседним значениям куска, а не перебором всех пар
+HASH_DB = os.path.join(CACHE_HOME, 'galery', 'hashes.sqlite')
+HASH_CHUNKS = 4
+HASH_CHUNK_BITS = 64 // HASH_CHUNKS
+SIMILAR_DISTANCE = 6
+HASH_FLUSH_SIZE = 500
+
+
+def dhash(image):
+    small = image.scaled(9, 8, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    small = small.convertToFormat(QImage.Format.Format_Grayscale8)
+    bits = small.constBits()
+    bits.setsize(small.sizeInBytes())
+    pixels = np.frombuffer(bits, np.uint8).reshape(8, small.bytesPerLine())[:, :9]
+    return int.from_bytes(np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes(), 'big')
+
+
+@lru_cache(maxsize=None)
+def chunk_masks(radius):
+    # Маски XOR для всех значений куска на расстоянии <= radius бит (для radius = 1 это 17 значений)
+    masks = []
+    for count in range(radius + 1):
+        for bits in combinations(range(HASH_CHUNK_BITS), count):
+            masks.append(sum(1 << bit for bit in bits))
+    return np.array(masks, dtype=np.uint64)
+
+
+def hash_chunk(values, number):
+    return (values >> np.uint64(HASH_CHUNK_BITS * number)) & np.uint64((1 << HASH_CHUNK_BITS) - 1)
+
+
+def chunk_tables(values):
+    tables = []
+    for number in range(HASH_CHUNKS):
+        chunks = hash_chunk(values, number)
+        order = np.argsort(chunks, kind='stable')
+        tables.append((chunks[order], order))
+    return tables
+
+
+def similar_pairs(values, distance=SIMILAR_DISTANCE):
+    # Все пары (i, j), i < j, с расстоянием <= distance: для каждого куска и каждой маски
+    # соседние значения находятся searchsorted-ом, пары разворачиваются векторно
+    masks = chunk_masks(distance // HASH_CHUNKS)
+    found = []
+    for number, (sorted_chunks, order) in enumerate(chunk_tables(values)):
+        chunks = hash_chunk(values, number)
+        for mask in masks:
+            keys = chunks ^ mask
+            low = np.searchsorted(sorted_chunks, keys, 'left')
+            counts = np.searchsorted(sorted_chunks, keys, 'right') - low
+            total = int(counts.sum())
+            if not total:
+                continue
+            left = np.repeat(np.arange(len(values)), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            right = order[np.repeat(low, counts) + offsets]
+            keep = left < right
+            left, right = left[keep], right[keep]
+            close = np.bitwise_count(values[left] ^ values[right]) <= distance
+            found.append(left[close] * len(values) + right[close])
+    if not found:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.concatenate(found))
+    return pairs // len(values), pairs % len(values)
+
+
+class ImageHashIndex:
+    def __init__(self, path=HASH_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                path TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                hash INTEGER NOT NULL
+            )
+        """)
+        self.db.commit()
+        self.pending = {}
+        # Хэши читаются из базы при первом поиске, а массивы индекса пересобираются лениво:
+        # во время импорта идут только вставки, и сортировать после каждой незачем
+        self.hashes = None
+        self.arrays = None
+
+    def add(self, path, mtime, size, value):
+        # SQLite хранит знаковые 64-битные числа
+        self.pending[path] = (int(mtime), size, value - (1 << 64) if value >= 1 << 63 else value)
+        if self.hashes is not None and self.hashes.get(path) != value:
+            self.hashes[path] = value
+            self.arrays = None
+        if len(self.pending) >= HASH_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.db.executemany(
+            "INSERT OR REPLACE INTO image_hashes (path, mtime, size, hash) VALUES (?, ?, ?, ?)",
+            [(path, *row) for path, row in self.pending.items()])
+        self.db.commit()
+        self.pending.clear()
+
+    def load(self):
+        if self.hashes is None:
+            self.flush()
+            self.hashes = {path: value & ((1 << 64) - 1) for path, value in self.db.execute("SELECT path, hash FROM image_hashes")}
+        if self.arrays is None:
+            paths = list(self.hashes)
+            values = np.fromiter(self.hashes.values(), dtype=np.uint64, count=len(paths))
+            self.arrays = (paths, values, chunk_tables(values))
+        return self.arrays
+
+    def similar(self, value, distance=SIMILAR_DISTANCE, paths=None):
+        all_paths, values, tables = self.load()
+        value = np.uint64(value)
+        masks = chunk_masks(distance // HASH_CHUNKS)
+        candidates = []
+        for number, (sorted_chunks, order) in enumerate(tables):
+            keys = hash_chunk(value, number) ^ masks
+            low = np.searchsorted(sorted_chunks, keys, 'left')
+            high = np.searchsorted(sorted_chunks, keys, 'right')
+            candidates.extend(order[start:stop] for start, stop in zip(low, high) if stop > start)
+        if not candidates:
+            return []
+        candidates = np.unique(np.concatenate(candidates))
+        distances = np.bitwise_count(values[candidates] ^ value)
+        close = distances <= distance
+        matches = [(int(d), all_paths[i]) for d, i in zip(distances[close], candidates[close])]
+        if paths is not None:
+            matches = [match for match in matches if match[1] in paths]
+        return sorted(matches)
+
+    def similar_to(self, path, distance=SIMILAR_DISTANCE, paths=None):
+        self.load()
+        value = self.hashes.get(path)
+        return [] if value is None else self.similar(value, distance, paths)
+
+    def duplicate_groups(self, paths, distance=SIMILAR_DISTANCE):
+        # Пары похожих ищутся векторно, затем объединяются в группы (система непересекающихся множеств)
+        self.load()
+        group_paths = [path for path in dict.fromkeys(paths) if path in self.hashes]
+        values = np.fromiter((self.hashes[path] for path in group_paths), dtype=np.uint64, count=len(group_paths))
+        parent = list(range(len(group_paths)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in zip(*similar_pairs(values, distance)):
+            a, b = find(int(i)), find(int(j))
+            if a != b:
+                parent[b] = a
+        groups = {}
+        for i, path in enumerate(group_paths):
+            groups.setdefault(find(i), []).append(path)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class DuplicatesDialog(QDialog):
+    path_activated = pyqtSignal(str)
+
+    def __init__(self, groups, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Похожие фото")
+        self.resize(600, 400)
+        layout = QVBoxLayout(self)
+        self.tree = QTreeWidget(self)
+        self.tree.setHeaderHidden(True)
+        for number, group in enumerate(groups, 1):
+            group_item = QTreeWidgetItem(self.tree, [f"Группа {number} ({len(group)})"])
+            for path in group:
+                item = QTreeWidgetItem(group_item, [path])
+                item.setData(0, Qt.ItemDataRole.UserRole, path)
+        self.tree.itemDoubleClicked.connect(self.on_item_activated)
+        layout.addWidget(QLabel(f"Найдено групп: {len(groups)}", self))
+        layout.addWidget(self.tree)
+
+    def on_item_activated(self, item):
+        path = item.data(0, Qt.ItemDataRole.UserRole)
+        if path:
+            self.path_activated.emit(path)
+
+
+# Каталог медиатеки: SQLite с путём, размером, mtime, размерами кадра, датой съёмки из EXIF,
+# ориентацией и ключом миниатюры. При запуске сетка строится из каталога, а файловая система
+# сверяется в фоне и дочитываются только новые и изменённые файлы. Дата для сортировки -
+# дата съёмки, а если её нет, mtime; сортировка и фильтр по ней идут по индексу
+CATALOG_PATH = os.path.join(DATA_HOME, 'galery', 'catalog.sqlite')
+CATALOG_FLUSH_SIZE = 500
+EXIF_READ_SIZE = 128 * 1024
+# Дата съёмки вне этих лет - мусор в EXIF (0000, 9999, сбитые часы камеры); тогда берётся mtime файла
+EXIF_MIN_YEAR = 1826
+
+
+def read_exif(path):
+    # Минимальный разбор EXIF в JPEG: дата съёмки (DateTimeOriginal, иначе DateTime) и ориентация
+    if not path.lower().endswith(('.jpg', '.jpeg')):
+        return None, None
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(EXIF_READ_SIZE)
+    except OSError:
+        return None, None
+    if data[:2] != b'\xff\xd8':
+        return None, None
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker == 0xDA:
+            break
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        if marker == 0xE1 and data[position + 4:position + 10] == b'Exif\0\0':
+            try:
+                return parse_exif(data[position + 10:position + 2 + length])
+            except (struct.error, ValueError, LookupError):
+                return None, None
+        position += 2 + length
+    return None, None
+
+
+def parse_exif(tiff):
+    order = {b'II': '<', b'MM': '>'}[tiff[:2]]
+
+    def entries(offset):
+        count = struct.unpack_from(order + 'H', tiff, offset)[0]
+        for i in range(count):
+            yield struct.unpack_from(order + 'HHI', tiff, offset + 2 + 12 * i) + (offset + 10 + 12 * i,)
+
+    def text(count, value):
+        start = struct.unpack_from(order + 'I', tiff, value)[0] if count > 4 else value
+        return tiff[start:start + count].split(b'\0')[0].decode('ascii', 'replace')
+
+    orientation = taken = exif_offset = None
+    for tag, kind, count, value in entries(struct.unpack_from(order + 'I', tiff, 4)[0]):
+        if tag == 0x0112:
+            orientation = struct.unpack_from(order + 'H', tiff, value)[0]
+        elif tag == 0x0132:
+            taken = text(count, value)
+        elif tag == 0x8769:
+            exif_offset = struct.unpack_from(order + 'I', tiff, value)[0]
+    if exif_offset:
+        for tag, kind, count, value in entries(exif_offset):
+            if tag == 0x9003:
+                taken = text(count, value)
+    try:
+        taken = datetime.strptime(taken.strip(), '%Y:%m:%d %H:%M:%S') if taken else None
+    except ValueError:
+        taken = None
+    if taken is not None and EXIF_MIN_YEAR <= taken.year <= datetime.now().year + 1:
+        timestamp = taken.timestamp()
+    else:
+        timestamp = None
+    return timestamp, orientation
+
+
+class MediaCatalog:
+    def __init__(self, path=CATALOG_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        # Сверка с диском читает каталог из потока обхода, поэтому у каждого потока своё соединение (WAL)
+        self.local = threading.local()
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                width INTEGER NOT NULL DEFAULT 0,
+                height INTEGER NOT NULL DEFAULT 0,
+                taken REAL,
+                orientation INTEGER,
+                thumbnail TEXT,
+                date REAL NOT NULL,
+                hidden INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS media_date ON media (hidden, date)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                recursive INTEGER NOT NULL
+            )
+        """)
+        self.db.commit()
+        self.pending = {}
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode = WAL")
+            self.local.db = db
+        return db
+
+    def add_folder(self, path, recursive):
+        self.db.execute("INSERT OR REPLACE INTO folders (path, recursive) VALUES (?, ?)", (path, int(recursive)))
+        self.db.commit()
+
+    def folders(self):
+        return [(path, bool(recursive)) for path, recursive in self.db.execute("SELECT path, recursive FROM folders")]
+
+    def add(self, path, metadata):
+        taken = metadata.get('taken')
+        self.pending[path] = (
+            metadata['size'], int(metadata['mtime']), metadata['width'], metadata['height'],
+            taken, metadata.get('orientation'), metadata.get('thumbnail'), taken or metadata['mtime'])
+        if len(self.pending) >= CATALOG_FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        # Скрытые пользователем файлы остаются скрытыми и после обновления метаданных
+        self.db.executemany("""
+            INSERT INTO media (path, size, mtime, width, height, taken, orientation, thumbnail, date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                size = excluded.size, mtime = excluded.mtime, width = excluded.width, height = excluded.height,
+                taken = excluded.taken, orientation = excluded.orientation, thumbnail = excluded.thumbnail,
+                date = excluded.date
+        """, [(path, *row) for path, row in self.pending.items()])
+        self.db.commit()
+        self.pending.clear()
+
+    def hide(self, paths):
+        self.flush()
+        self.db.executemany("UPDATE media SET hidden = 1 WHERE path = ?", [(path,) for path in paths])
+        self.db.commit()
+
+    def remove(self, paths):
+        removed = set(paths)
+        self.pending = {path: row for path, row in self.pending.items() if path not in removed}
+        self.db.executemany("DELETE FROM media WHERE path = ?", [(path,) for path in paths])
+        self.db.commit()
+
+    def items(self, newest_first=True, start=None, end=None):
+        # (hidden, date) - индекс и для сортировки, и для диапазона дат
+        query = "SELECT path, width, height FROM media WHERE hidden = 0"
+        args = []
+        if start is not None:
+            query += " AND date >= ?"
+            args.append(start)
+        if end is not None:
+            query += " AND date < ?"
+            args.append(end)
+        query += " ORDER BY date DESC" if newest_first else " ORDER BY date"
+        return self.db.execute(query, args).fetchall()
+
+    def years(self):
+        # Границы берутся из индекса, а каждый год проверяется одним коротким поиском по нему же
+        first, last = self.db.execute("SELECT MIN(date), MAX(date) FROM media WHERE hidden = 0").fetchone()
+        if first is None:
+            return []
+        years = []
+        for year in range(datetime.fromtimestamp(last).year, datetime.fromtimestamp(first).year - 1, -1):
+            start, end = year_range(year)
+            if self.db.execute("SELECT 1 FROM media WHERE hidden = 0 AND date >= ? AND date < ? LIMIT 1", (start, end)).fetchone():
+                years.append(year)
+        return years
+
+    def snapshot(self):
+        return {path: (size, mtime) for path, size, mtime in self.db.execute("SELECT path, size, mtime FROM media")}
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def year_range(year):
+    # У последнего года, который представим в datetime, следующего нет - диапазон открыт сверху
+    end = datetime(year + 1, 1, 1).timestamp() if year < datetime.max.year else math.inf
+    return datetime(year, 1, 1).timestamp(), end
+
+
+# Импорт папки: обход каталогов в отдельном потоке, найденные файлы приходят в GUI пачками,
+# чтобы список наполнялся по ходу обхода, а не после него. При сверке с каталогом (known)
+# приходят только новые и изменённые файлы, а пропавшие с диска - отдельным сигналом
+SCAN_BATCH_SIZE = 200
+
+
+class FolderScanner(QObject):
+    found = pyqtSignal(list)
+    missing = pyqtSignal(list)
+    finished = pyqtSignal()
+
+    def __init__(self, roots, known=None):
+        super().__init__()
+        self.roots = roots
+        self.known = known
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            # known - функция, чтобы снимок каталога читался уже в этом потоке, а не в GUI
+            known = self.known() if self.known is not None else None
+            seen = set()
+            batch = []
+            for root, recursive in self.roots:
+                stack = [root]
+                while stack and not self.cancelled.is_set():
+                    try:
+                        entries = list(os.scandir(stack.pop()))
+                    except OSError:
+                        continue
+                    for entry in sorted(entries, key=lambda entry: entry.name):
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                            if known is not None:
+                                seen.add(entry.path)
+                                if self.unchanged(known.get(entry.path), entry.path, entry):
+                                    continue
+                            batch.append(entry.path)
+                            if len(batch) >= SCAN_BATCH_SIZE:
+                                self.found.emit(batch)
+                                batch = []
+            if known is not None and not self.cancelled.is_set():
+                # Файлы каталога вне обойдённых папок (добавленные по одному) проверяются напрямую
+                missing = []
+                for path in known.keys() - seen:
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        missing.append(path)
+                        continue
+                    if not self.unchanged(known[path], path, stat):
+                        batch.append(path)
+                if missing:
+                    self.missing.emit(missing)
+            if batch and not self.cancelled.is_set():
+                self.found.emit(batch)
+        finally:
+            self.finished.emit()
+
+    def unchanged(self, record, path, entry):
+        if record is None:
+            return False
+        try:
+            stat = entry.stat() if isinstance(entry, os.DirEntry) else entry
+        except OSError:
+            return False
+        return record == (stat.st_size, int(stat.st_mtime))
+
+
+# Сетка галереи: модель хранит только пути, миниатюры запрашиваются для видимых строк
+# и PREFETCH_SCREENS экранов вокруг, а готовые пиксмапы живут в кэше с ограничением по памяти
+ICON_SIZE = 100
+GRID_SIZE = QSize(ICON_SIZE + 12, ICON_SIZE + 12)
+PREFETCH_SCREENS = 1
+THUMBNAIL_MEMORY_BUDGET = int(os.environ.get('GALERY_THUMBNAIL_MEMORY_MB', '64')) * 1024 * 1024
+
+
+def placeholder_pixmap():
+    pixmap = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    pixmap.fill(QColor(200, 200, 200))
+    return pixmap
+
+
+class PixmapMemoryCache:
+    def __init__(self, budget=THUMBNAIL_MEMORY_BUDGET):
+        self.budget = budget
+        self.pixmaps = OrderedDict()
+        self.used = 0
+
+    def __contains__(self, path):
+        return path in self.pixmaps
+
+    def __len__(self):
+        return len(self.pixmaps)
+
+    def cost(self, pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, path):
+        pixmap = self.pixmaps.get(path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(path)
+        return pixmap
+
+    def put(self, path, pixmap, keep=()):
+        old = self.pixmaps.pop(path, None)
+        if old is not None:
+            self.used -= self.cost(old)
+        self.pixmaps[path] = pixmap
+        self.used += self.cost(pixmap)
+        self.evict(keep)
+
+    def evict(self, keep=()):
+        # Вытесняются давно не показанные пиксмапы; то, что сейчас в окне просмотра, не трогаем,
+        # даже если бюджет меньше одного экрана
+        if self.used <= self.budget:
+            return
+        for path in list(self.pixmaps):
+            if self.used <= self.budget:
+                break
+            if path not in keep:
+                self.used -= self.cost(self.pixmaps.pop(path))
+
+    def clear(self):
+        self.pixmaps.clear()
+        self.used = 0
+
+
+class MediaListModel(QAbstractListModel):
+    def __init__(self, thumbnails, placeholder, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        self.path_set = set()
+        self.dimensions = {}
+        self.thumbnails = thumbnails
+        self.placeholder = placeholder
+        self.video_pixmap = QPixmap('path_to_video_icon.png')
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == Qt.ItemDataRole.DecorationRole:
+            pixmap = self.thumbnails.get(path)
+            if pixmap is not None:
+                return pixmap
+            if path.lower().endswith(VIDEO_EXTENSIONS) and not self.video_pixmap.isNull():
+                return self.video_pixmap
+            return self.placeholder
+        if role == Qt.ItemDataRole.ToolTipRole:
+            size = self.dimensions.get(path)
+            return f"{os.path.basename(path)}\n{size[0]}×{size[1]}" if size else os.path.basename(path)
+        if role == Qt.ItemDataRole.UserRole:
+            return path
+        return None
+
+    def set_items(self, items):
+        self.beginResetModel()
+        self.paths = [path for path, _, _ in items]
+        self.path_set = set(self.paths)
+        self.dimensions = {path: (width, height) for path, width, height in items if width}
+        self.endResetModel()
+
+    def add_paths(self, paths):
+        paths = [path for path in dict.fromkeys(paths) if path not in self.path_set]
+        if not paths:
+            return
+        row = len(self.paths)
+        self.beginInsertRows(QModelIndex(), row, row + len(paths) - 1)
+        self.paths.extend(paths)
+        self.path_set.update(paths)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        rows = set(rows)
+        for row in rows:
+            self.path_set.discard(self.paths[row])
+            self.dimensions.pop(self.paths[row], None)
+        if len(rows) > 100:
+            # Массовое удаление (файлы пропали с диска) - одним сбросом, а не тысячами сдвигов списка
+            self.beginResetModel()
+            self.paths = [path for row, path in enumerate(self.paths) if row not in rows]
+            self.endResetModel()
+            return
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.paths[row]
+            self.endRemoveRows()
+
+    def remove_paths(self, paths):
+        paths = set(paths) & self.path_set
+        if paths:
+            self.remove_rows([row for row, path in enumerate(self.paths) if path in paths])
+
+    def set_dimensions(self, path, width, height):
+        if width:
+            self.dimensions[path] = (width, height)
+
+    def refresh(self, first, last):
+        if first <= last:
+            self.dataChanged.emit(self.index(first), self.index(last), [Qt.ItemDataRole.DecorationRole])
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    def paint(self, painter, option, index):
+        # Рисуем только пиксмап по центру ячейки: без текста и QIcon, которые делегат по умолчанию
+        # пересоздаёт при каждой отрисовке
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        if pixmap is None or pixmap.isNull():
+            return
+        size = pixmap.size().scaled(option.decorationSize, Qt.AspectRatioMode.KeepAspectRatio)
+        target = QRect(0, 0, size.width(), size.height())
+        target.moveCenter(option.rect.center())
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawPixmap(target, pixmap)
+
+    def sizeHint(self, option, index):
+        return GRID_SIZE
+
+
+# Размытие: изображение уменьшается так, чтобы радиус стал BLUR_WORK_RADIUS пикселей,
+# размывается тремя проходами скользящего среднего по строкам и столбцам (приближение Гаусса)
+# прямо в буфере QImage через NumPy и растягивается обратно. Результаты кэшируются
+BLUR_RADIUS = 20
+BLUR_WORK_RADIUS = 3
+BLUR_PASSES = 3
+BLUR_CACHE_SIZE = 8
+# Фон всё равно размывается, поэтому полноразмерный кадр для него не декодируется
+BLUR_SOURCE_SIZE = 1024
+
+
+def image_array(image):
+    # Представление пикселей QImage как массива (h, w, 4) без копирования; пока массив жив,
+    # должен жить и image
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    rows = np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine())
+    return rows[:, :image.width() * 4].reshape(image.height(), image.width(), 4)
+
+
+def box_blur(pixels, radius, axis):
+    # Скользящее среднее суммой сдвинутых срезов: после уменьшения радиус всего несколько
+    # пикселей, и это быстрее кумулятивной суммы
+    pad = [(0, 0)] * pixels.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(pixels, pad, mode='edge')
+    window = [slice(None)] * pixels.ndim
+    length = pixels.shape[axis]
+    window[axis] = slice(0, length)
+    total = padded[tuple(window)].copy()
+    for shift in range(1, 2 * radius + 1):
+        window[axis] = slice(shift, shift + length)
+        total += padded[tuple(window)]
+    total *= 1.0 / (2 * radius + 1)
+    return total
+
+
+def blur_image(image, size, radius=BLUR_RADIUS):
+    if image.isNull() or size.isEmpty():
+        return QImage()
+    # Премультиплицированная альфа позволяет размывать все четыре канала одинаково
+    image = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+    scale = min(1.0, BLUR_WORK_RADIUS / radius) if radius > 0 else 1.0
+    small = image.scaled(max(1, round(size.width() * scale)), max(1, round(size.height() * scale)),
+                         Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    pixels = image_array(small).astype(np.float32)
+    work_radius = max(1, round(radius * scale))
+    for _ in range(BLUR_PASSES):
+        pixels = box_blur(pixels, work_radius, 0)
+        pixels = box_blur(pixels, work_radius, 1)
+    result = np.ascontiguousarray(np.clip(pixels + 0.5, 0, 255).astype(np.uint8))
+    blurred = QImage(result.data, result.shape[1], result.shape[0], result.strides[0], QImage.Format.Format_ARGB32_Premultiplied)
+    # Возвращаемое изображение должно владеть своими пикселями: буфер result освободится при выходе.
+    # scaled() к тому же размеру пикселей не копирует, поэтому в этом случае копируем явно
+    if blurred.size() == size:
+        return blurred.copy()
+    return blurred.scaled(size, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+
+class BlurCache:
+    def __init__(self, capacity=BLUR_CACHE_SIZE):
+        self.capacity = capacity
+        self.pixmaps = OrderedDict()
+
+    def pixmap(self, image, size, radius=BLUR_RADIUS):
+        key = (image.cacheKey(), size.width(), size.height(), radius)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(blur_image(image, size, radius))
+            self.pixmaps[key] = pixmap
+            while len(self.pixmaps) > self.capacity:
+                self.pixmaps.popitem(last=False)
+        self.pixmaps.move_to_end(key)
+        return pixmap
+
+
+blur_cache = BlurCache()
+
 
 class BlurEffectWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.image_path = ""
+        self.source = QImage()
+        self.radius = BLUR_RADIUS
         self.init_ui()
 
     def init_ui(self):
         self.layout = QVBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
         self.image_label = QLabel(self)
+        # Размер задаёт раскладка, а не размытая картинка: иначе виджет не смог бы уменьшаться
+        self.image_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
         self.layout.addWidget(self.image_label)
 
     def set_image(self, image_path):
         self.image_path = image_path
-        pixmap = QPixmap(image_path)
-        self.image_label.setPixmap(self.apply_blur_effect(pixmap))
+        self.source = decode_scaled(image_path, BLUR_SOURCE_SIZE)[0]
+        self.updateGeometry()
+        self.update_pixmap()
+
+    def sizeHint(self):
+        # Как у QLabel с картинкой: желаемый размер - размер исходника, но раскладка может его ужать
+        return super().sizeHint() if self.source.isNull() else self.source.size()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_pixmap()
 
-    def apply_blur_effect(self, pixmap):
-        image = pixmap.toImage()
-        blurred_image = image.blurred(radius=20)  # Используем метод blurred для эффекта blur
-        return QPixmap.fromImage(blurred_image)
+    def update_pixmap(self):
+        if self.source.isNull() or self.image_label.size().isEmpty():
+            self.image_label.clear()
+            return
+        self.image_label.setPixmap(self.apply_blur_effect(self.source, self.image_label.size()))
+
+    def apply_blur_effect(self, image, size=None):
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        # Размытая картинка считается один раз на исходник, размер и радиус; перерисовки её только копируют
+        return blur_cache.pixmap(image, size or image.size(), self.radius)
 
 class VideoWidget(QWidget):
     def __init__(self, video_path, parent=None):
@@ -37,10 +1036,471 @@ class VideoWidget(QWidget):
         self.video_widget = QVideoWidget(self)
         self.layout.addWidget(self.video_widget)
         self.media_player = QMediaPlayer(self)
+        self.audio_output = QAudioOutput(self)
+        self.media_player.setAudioOutput(self.audio_output)
         self.media_player.setVideoOutput(self.video_widget)
-        self.media_player.setMedia(QUrl.fromLocalFile(self.video_path))
+        self.media_player.setSource(QUrl.fromLocalFile(self.video_path))
         self.media_player.play()
 
+# Просмотр больших изображений: пирамида тайлов TILE_SIZE x TILE_SIZE, уровень L - изображение,
+# уменьшенное в 2^L раз. Тайлы декодируются прямо из файла с обрезкой и масштабированием
+# (QImageReader.setClipRect + setScaledSize: JPEG при этом не разворачивается в память целиком).
+# JPEG всё равно приходится читать построчно до нужного места, поэтому декодируется сразу полоса
+# тайлов во всю ширину, и все её тайлы ложатся в дисковый кэш. Форматы без обрезки и масштабирования
+# при чтении (PNG, BMP, GIF) декодируются целиком один раз - по одному файлу за раз и под поднятым,
+# но ограниченным FULL_DECODE_LIMIT лимитом памяти; пока снимок открыт, декодированный кадр
+# (и последний уменьшенный уровень) держится в пирамиде, и полосы режутся из него. В памяти тайлы держатся
+# в пределах бюджета; запрашиваются только видимые при текущем масштабе, пока их нет, рисуется более грубый уровень
+TILE_SIZE = 512
+TILE_DIR = os.path.join(CACHE_HOME, 'galery', 'tiles')
+TILE_MEMORY_BUDGET = int(os.environ.get('GALERY_TILE_MEMORY_MB', '96')) * 1024 * 1024
+# Полоса уровня 0 для снимка шириной 20000 - около 40 МБ, одновременно декодируется не больше стольких
+TILE_DECODERS = min(2, os.cpu_count() or 1)
+# В мегабайтах, как QImageReader.allocationLimit(): хватает на ARGB 11000 x 11000
+FULL_DECODE_LIMIT = int(os.environ.get('GALERY_FULL_DECODE_MB', '512'))
+FULL_DECODE_LOCK = threading.Lock()
+VIEWER_MAX_ZOOM = 8.0
+
+
+class TilePyramid:
+    def __init__(self, path, directory=TILE_DIR):
+        self.path = path
+        reader = QImageReader(path)
+        reader.setAutoTransform(False)
+        self.size = reader.size()
+        option = QImageIOHandler.ImageOption
+        self.clip_decoding = reader.supportsOption(option.ClipRect) and reader.supportsOption(option.ScaledSize)
+        key = Path(os.path.abspath(path)).as_uri()
+        try:
+            stat = os.stat(path)
+            key += f":{int(stat.st_mtime)}:{stat.st_size}"
+        except OSError:
+            # Файл пропал или недоступен: тайлов всё равно не будет, но окно просмотра должно открыться
+            pass
+        self.directory = os.path.join(directory, hashlib.md5(key.encode('utf-8')).hexdigest())
+        # Прозрачность JPEG не сохранит, для остальных форматов тайлы в PNG
+        self.format = 'JPG' if path.lower().endswith(('.jpg', '.jpeg')) else 'PNG'
+        longest = max(self.size.width(), self.size.height(), 1)
+        self.top = max(0, math.ceil(math.log2(longest / TILE_SIZE)))
+        self.full_image = None
+        self.level_image = None
+
+    def decoded_level(self, level):
+        # Только под FULL_DECODE_LOCK. allocationLimit общий для всех QImageReader,
+        # поэтому поднимается лишь на время чтения
+        if self.full_image is None:
+            previous = QImageReader.allocationLimit()
+            QImageReader.setAllocationLimit(max(previous, FULL_DECODE_LIMIT))
+            try:
+                reader = QImageReader(self.path)
+                reader.setAutoTransform(False)
+                self.full_image = reader.read()
+            finally:
+                QImageReader.setAllocationLimit(previous)
+        if level == 0 or self.full_image.isNull():
+            return self.full_image
+        if self.level_image is None or self.level_image[0] != level:
+            size = self.scaled_size(level, QRect(QPoint(0, 0), self.size))
+            self.level_image = (level, self.full_image.scaled(size, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                                              Qt.TransformationMode.SmoothTransformation))
+        return self.level_image[1]
+
+    def level_for(self, zoom):
+        if zoom >= 1:
+            return 0
+        return min(self.top, int(math.floor(math.log2(1 / zoom))))
+
+    def tile_rect(self, level, col, row):
+        span = TILE_SIZE << level
+        return QRect(col * span, row * span, span, span).intersected(QRect(QPoint(0, 0), self.size))
+
+    def band_rect(self, level, row):
+        span = TILE_SIZE << level
+        return QRect(0, row * span, self.size.width(), span).intersected(QRect(QPoint(0, 0), self.size))
+
+    def scaled_size(self, level, rect):
+        return QSize(max(1, math.ceil(rect.width() / (1 << level))), max(1, math.ceil(rect.height() / (1 << level))))
+
+    def tiles(self, level, rect):
+        span = TILE_SIZE << level
+        rect = rect.intersected(QRectF(0, 0, self.size.width(), self.size.height()))
+        if rect.isEmpty():
+            return []
+        cols = range(int(rect.left()) // span, int(math.ceil(rect.right())) // span + 1)
+        rows = range(int(rect.top()) // span, int(math.ceil(rect.bottom())) // span + 1)
+        return [(level, col, row) for row in rows for col in cols if not self.tile_rect(level, col, row).isEmpty()]
+
+    def cache_path(self, key):
+        return os.path.join(self.directory, '{}_{}_{}.{}'.format(*key, self.format.lower()))
+
+
+class TileSignals(QObject):
+    ready = pyqtSignal(object, object, QImage)
+    done = pyqtSignal(object, object)
+
+
+class TileTask(QRunnable):
+    def __init__(self, pyramid, band, cols, signals, cancelled):
+        super().__init__()
+        self.pyramid = pyramid
+        self.band = band
+        self.cols = cols
+        self.signals = signals
+        self.cancelled = cancelled
+
+    def run(self):
+        try:
+            if not self.cancelled.is_set():
+                self.load_band()
+        finally:
+            self.signals.done.emit(self.pyramid, self.band)
+
+    def load_band(self):
+        level, row = self.band
+        missing = self.load_cached(level, row, self.cols)
+        if not missing or self.cancelled.is_set():
+            return
+        if not self.pyramid.clip_decoding:
+            self.load_level(level, row, missing)
+            return
+        rect = self.pyramid.band_rect(level, row)
+        reader = QImageReader(self.pyramid.path)
+        reader.setAutoTransform(False)
+        reader.setClipRect(rect)
+        reader.setScaledSize(self.pyramid.scaled_size(level, rect))
+        band = reader.read()
+        if not band.isNull():
+            self.store_band(level, row, band, missing)
+
+    def load_cached(self, level, row, cols):
+        # Возвращает столбцы, которых ещё нет в дисковом кэше
+        missing = []
+        for col in cols:
+            cache_path = self.pyramid.cache_path((level, col, row))
+            image = QImage(cache_path) if os.path.exists(cache_path) else QImage()
+            if image.isNull():
+                missing.append(col)
+            else:
+                self.signals.ready.emit(self.pyramid, (level, col, row), image)
+        return missing
+
+    def load_level(self, level, row, missing):
+        with FULL_DECODE_LOCK:
+            if self.cancelled.is_set():
+                return
+            image = self.pyramid.decoded_level(level)
+        if not image.isNull():
+            band = image.copy(0, row * TILE_SIZE, image.width(), TILE_SIZE)
+            self.store_band(level, row, band, missing)
+
+    def store_band(self, level, row, band, missing):
+        try:
+            os.makedirs(self.pyramid.directory, exist_ok=True)
+        except OSError:
+            pass
+        col = 0
+        while col * TILE_SIZE < band.width():
+            key = (level, col, row)
+            tile = band.copy(col * TILE_SIZE, 0, min(TILE_SIZE, band.width() - col * TILE_SIZE), band.height())
+            try:
+                save_image_atomic(tile, self.pyramid.cache_path(key), self.pyramid.format)
+            except OSError:
+                pass
+            if col in missing:
+                self.signals.ready.emit(self.pyramid, key, tile)
+            col += 1
+
+
+# Листание снимков: кадр декодируется сразу под размер экрана (для JPEG это масштабирование
+# при декодировании, а не полный кадр), готовые кадры лежат в LRU с бюджетом памяти.
+# Следующие DECODE_AHEAD снимков по направлению листания и один позади декодируются заранее
+# в отдельном пуле; при переходе в другое место очередь для ставших ненужными снимков снимается
+DECODE_AHEAD = 3
+DECODE_MEMORY_BUDGET = int(os.environ.get('GALERY_DECODE_MEMORY_MB', '128')) * 1024 * 1024
+
+
+def preview_size():
+    screen = QApplication.primaryScreen()
+    if screen is None:
+        return 2048
+    size = screen.size() * screen.devicePixelRatio()
+    return max(size.width(), size.height(), 1024)
+
+
+class PreviewSignals(QObject):
+    ready = pyqtSignal(str, QImage)
+    done = pyqtSignal(str)
+
+
+class PreviewTask(QRunnable):
+    def __init__(self, path, size, signals, cancelled):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.signals = signals
+        self.cancelled = cancelled
+
+    def run(self):
+        try:
+            if not self.cancelled.is_set():
+                # Без поворота по EXIF, как и тайлы, иначе кадр и тайлы не совпадут
+                image = decode_scaled(self.path, self.size, auto_transform=False)[0]
+                if not image.isNull():
+                    self.signals.ready.emit(self.path, image)
+        finally:
+            self.signals.done.emit(self.path)
+
+
+class ImagePrefetcher(QObject):
+    ready = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.size = preview_size()
+        self.images = PixmapMemoryCache(DECODE_MEMORY_BUDGET)
+        self.signals = PreviewSignals()
+        self.signals.ready.connect(self.on_ready)
+        self.signals.done.connect(self.on_done)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(min(DECODE_AHEAD, os.cpu_count() or 1))
+        self.requests = {}
+        self.wanted = set()
+
+    def get(self, path):
+        return self.images.get(path)
+
+    def browse(self, paths, index, direction=0):
+        # direction: +1 / -1 - шаг вперёд / назад, 0 - переход в произвольное место
+        step = -1 if direction < 0 else 1
+        order = [index] + [index + step * offset for offset in range(1, DECODE_AHEAD + 1)] + [index - step]
+        wanted = [paths[i] for i in order if 0 <= i < len(paths)]
+        self.wanted = set(wanted)
+        for path in list(self.requests):
+            if path not in self.wanted:
+                self.requests.pop(path).set()
+        # Текущий снимок - с наивысшим приоритетом, дальше по удалённости
+        for priority, path in enumerate(reversed(wanted)):
+            if path in self.images or path in self.requests:
+                continue
+            cancelled = threading.Event()
+            self.requests[path] = cancelled
+            self.pool.start(PreviewTask(path, self.size, self.signals, cancelled), priority)
+
+    def on_ready(self, path, image):
+        self.images.put(path, QPixmap.fromImage(image), self.wanted)
+        self.ready.emit(path)
+
+    def on_done(self, path):
+        self.requests.pop(path, None)
+
+
+class ImageViewer(QWidget):
+    def __init__(self, path, parent=None, paths=None, prefetcher=None):
+        super().__init__(parent, Qt.WindowType.Window)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.setWindowTitle(os.path.basename(path))
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.resize(1000, 700)
+        self.tiles = PixmapMemoryCache(TILE_MEMORY_BUDGET)
+        self.signals = TileSignals()
+        self.signals.ready.connect(self.on_tile_ready)
+        self.signals.done.connect(self.on_tile_done)
+        # Свой пул: при закрытии окна или смене снимка очередь тайлов сбрасывается целиком
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(TILE_DECODERS)
+        self.requests = {}
+        self.visible_keys = set()
+        self.zoom = 1.0
+        self.origin = QPointF(0, 0)
+        self.fitted = True
+        self.drag_position = None
+        self.paths = paths or [path]
+        self.index = self.paths.index(path) if path in self.paths else 0
+        self.prefetcher = prefetcher or ImagePrefetcher(self)
+        self.prefetcher.ready.connect(self.on_preview_ready)
+        self.preview = None
+        self.set_path(path)
+
+    def set_path(self, path, direction=0):
+        self.cancel_requests()
+        self.tiles.clear()
+        self.path = path
+        self.setWindowTitle(os.path.basename(path))
+        self.pyramid = TilePyramid(path)
+        self.preview = self.prefetcher.get(path)
+        self.prefetcher.browse(self.paths, self.index, direction)
+        self.fit()
+
+    def step(self, delta):
+        index = self.index + delta
+        if 0 <= index < len(self.paths):
+            self.index = index
+            self.set_path(self.paths[index], delta)
+
+    def on_preview_ready(self, path):
+        if path == self.path and self.preview is None:
+            self.preview = self.prefetcher.get(path)
+            self.update_view()
+
+    def preview_covers(self):
+        # Пока экранного кадра хватает по детализации, тайлы не нужны
+        if self.preview is None or self.pyramid.size.width() <= 0:
+            return False
+        return self.zoom <= self.preview.width() / self.pyramid.size.width() * 1.01
+
+    def fit_zoom(self):
+        width, height = self.pyramid.size.width(), self.pyramid.size.height()
+        if width <= 0 or height <= 0:
+            return 1.0
+        return min(self.width() / width, self.height() / height, 1.0)
+
+    def fit(self):
+        self.fitted = True
+        self.zoom = self.fit_zoom()
+        self.origin = QPointF((self.pyramid.size.width() - self.width() / self.zoom) / 2,
+                              (self.pyramid.size.height() - self.height() / self.zoom) / 2)
+        self.update_view()
+
+    def zoom_at(self, position, zoom):
+        zoom = max(min(self.fit_zoom(), 1.0), min(VIEWER_MAX_ZOOM, zoom))
+        anchor = self.origin + QPointF(position) / self.zoom
+        self.zoom = zoom
+        self.origin = anchor - QPointF(position) / zoom
+        self.fitted = False
+        self.update_view()
+
+    def visible_rect(self):
+        return QRectF(self.origin, QSize(self.width(), self.height()).toSizeF() / self.zoom)
+
+    def to_screen(self, rect):
+        return QRectF((QPointF(rect.topLeft()) - self.origin) * self.zoom, rect.size().toSizeF() * self.zoom)
+
+    def update_view(self):
+        level = self.pyramid.level_for(self.zoom)
+        if self.preview_covers():
+            keys = []
+        elif self.preview is not None:
+            keys = self.pyramid.tiles(level, self.visible_rect())
+        else:
+            # Без экранного кадра подложкой служит самый грубый уровень - один тайл на весь снимок
+            keys = self.pyramid.tiles(level, self.visible_rect()) + [(self.pyramid.top, 0, 0)]
+        self.visible_keys = set(keys)
+        bands = {}
+        for key in keys:
+            if key not in self.tiles:
+                bands.setdefault((key[0], key[2]), []).append(key[1])
+        for band in list(self.requests):
+            if band not in bands:
+                self.requests.pop(band)[0].set()
+        # Сначала подложка, потом полосы ближе к центру экрана
+        center_row = self.visible_rect().center().y()
+        order = sorted(bands, key=lambda band: (band[0] != self.pyramid.top,
+                                                abs(QRectF(self.pyramid.band_rect(*band)).center().y() - center_row)))
+        for priority, band in enumerate(reversed(order)):
+            if band in self.requests:
+                continue
+            cancelled = threading.Event()
+            self.requests[band] = (cancelled, bands[band])
+            self.pool.start(TileTask(self.pyramid, band, bands[band], self.signals, cancelled), priority)
+        self.update()
+
+    def cancel_requests(self):
+        for cancelled, _ in self.requests.values():
+            cancelled.set()
+        self.requests.clear()
+        self.pool.clear()
+
+    def on_tile_ready(self, pyramid, key, image):
+        # Тайлы прежнего снимка, успевшие декодироваться после смены, отбрасываем
+        if pyramid is not self.pyramid:
+            return
+        self.tiles.put(key, QPixmap.fromImage(image), self.visible_keys)
+        self.update()
+
+    def on_tile_done(self, pyramid, band):
+        if pyramid is not self.pyramid or band not in self.requests:
+            return
+        _, cols = self.requests.pop(band)
+        # Пока полоса декодировалась, могли понадобиться другие её тайлы - они уже на диске.
+        # Повторно не просим только те, что не удалось декодировать
+        level, row = band
+        if any(key[0] == level and key[2] == row and key[1] not in cols and key not in self.tiles for key in self.visible_keys):
+            self.update_view()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(20, 20, 20))
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        if self.preview is not None:
+            painter.drawPixmap(self.to_screen(QRect(QPoint(0, 0), self.pyramid.size)), self.preview, QRectF(self.preview.rect()))
+            if self.preview_covers():
+                return
+        level = self.pyramid.level_for(self.zoom)
+        for key in self.pyramid.tiles(level, self.visible_rect()):
+            target = self.to_screen(self.pyramid.tile_rect(*key))
+            pixmap = self.tiles.get(key)
+            if pixmap is not None:
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+                continue
+            # Пока тайла нет, его место заполняет ближайший готовый тайл более грубого уровня
+            _, col, row = key
+            for coarse in range(level + 1, self.pyramid.top + 1):
+                shift = coarse - level
+                parent = self.tiles.get((coarse, col >> shift, row >> shift))
+                if parent is not None:
+                    painter.save()
+                    painter.setClipRect(target)
+                    painter.drawPixmap(self.to_screen(self.pyramid.tile_rect(coarse, col >> shift, row >> shift)), parent, QRectF(parent.rect()))
+                    painter.restore()
+                    break
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.fitted:
+            self.fit()
+        else:
+            self.update_view()
+
+    def wheelEvent(self, event):
+        self.zoom_at(event.position(), self.zoom * 1.25 ** (event.angleDelta().y() / 120))
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.drag_position = event.position()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_position is not None:
+            self.origin -= (event.position() - self.drag_position) / self.zoom
+            self.drag_position = event.position()
+            self.fitted = False
+            self.update_view()
+
+    def mouseReleaseEvent(self, event):
+        self.drag_position = None
+
+    def mouseDoubleClickEvent(self, event):
+        if self.fitted:
+            self.zoom_at(event.position(), 1.0)
+        else:
+            self.fit()
+
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key.Key_0, Qt.Key.Key_Home):
+            self.fit()
+        elif event.key() in (Qt.Key.Key_Right, Qt.Key.Key_Space, Qt.Key.Key_PageDown):
+            self.step(1)
+        elif event.key() in (Qt.Key.Key_Left, Qt.Key.Key_Backspace, Qt.Key.Key_PageUp):
+            self.step(-1)
+        elif event.key() == Qt.Key.Key_Escape:
+            self.close()
+        else:
+            super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        self.cancel_requests()
+        super().closeEvent(event)
+
+
 class GalleryApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -51,73 +1511,390 @@ class GalleryApp(QMainWindow):
         self.setCentralWidget(main_widget)
         main_layout = QVBoxLayout(main_widget)
 
-        # Создаем фоновый виджет с эффектом blur
-        background_label = QLabel(main_widget)
-        pixmap = QPixmap('path_to_background_image.jpg')
-        background_label.setPixmap(pixmap)
-        blur_effect = QGraphicsBlurEffect()
-        blur_effect.setBlurRadius(20)
-        background_label.setGraphicsEffect(blur_effect)
-        main_layout.addWidget(background_label)
-
-        # Создаем область прокрутки
-        scroll_area = QScrollArea(self)
-        scroll_area.setWidgetResizable(True)
-        scroll_area_widget = QWidget()
-        scroll_area_layout = QVBoxLayout(scroll_area_widget)
-        scroll_area.setWidget(scroll_area_widget)
-        main_layout.addWidget(scroll_area)
-
-        # Добавляем список для фото и видео
-        self.media_list = QListWidget()
-        self.media_list.setIconSize(QSize(100, 100))  # Устанавливаем размер иконок
-        self.media_list.setViewMode(QListWidget.IconMode)  # Устанавливаем режим отображения
-        self.media_list.setResizeMode(QListWidget.AdjustSize)  # Устанавливаем автоматический размер
-        scroll_area_layout.addWidget(self.media_list)
+        # Создаем фоновый виджет с эффектом blur (размывается один раз, а не при каждой перерисовке)
+        self.background = BlurEffectWidget(main_widget)
+        self.background.set_image('path_to_background_image.jpg')
+        main_layout.addWidget(self.background)
+
+        # Миниатюры строятся в фоне, до их готовности показывается заглушка
+        self.thumbnail_cache = ThumbnailCache()
+        self.thumbnail_signals = ThumbnailSignals()
+        self.thumbnail_signals.ready.connect(self.on_thumbnail_ready)
+        self.thumbnail_signals.done.connect(self.on_thumbnail_done)
+        self.thumbnail_signals.missing.connect(self.on_video_thumbnail_missing)
+        self.thumbnail_signals.failed.connect(self.on_thumbnail_failed)
+        self.video_thumbnailer = VideoThumbnailer(self.thumbnail_cache, self.thumbnail_signals, parent=self)
+        self.image_hashes = ImageHashIndex()
+        self.image_prefetcher = ImagePrefetcher(self)
+        self.catalog = MediaCatalog()
+        # Метаданные из пайплайна пишутся в базы пачками
+        self.metadata_flush_timer = QTimer(self)
+        self.metadata_flush_timer.setSingleShot(True)
+        self.metadata_flush_timer.setInterval(2000)
+        self.metadata_flush_timer.timeout.connect(self.image_hashes.flush)
+        self.metadata_flush_timer.timeout.connect(self.catalog.flush)
+        self.thumbnail_memory = PixmapMemoryCache()
+        self.thumbnail_requests = {}
+        self.thumbnail_window = (0, -1)
+        self.thumbnail_wanted = set()
+
+        # Список фото и видео: модель + делегат, отрисовываются только видимые ячейки.
+        # Собственная прокрутка у QListView, внешняя QScrollArea не нужна
+        self.media_model = MediaListModel(self.thumbnail_memory, placeholder_pixmap(), self)
+        self.media_list = QListView()
+        self.media_list.setModel(self.media_model)
+        self.media_list.setItemDelegate(ThumbnailDelegate(self.media_list))
+        self.media_list.setIconSize(QSize(ICON_SIZE, ICON_SIZE))  # Устанавливаем размер иконок
+        self.media_list.setGridSize(GRID_SIZE)
+        self.media_list.setViewMode(QListView.ViewMode.IconMode)  # Устанавливаем режим отображения
+        self.media_list.setResizeMode(QListView.ResizeMode.Adjust)  # Устанавливаем автоматический размер
+        self.media_list.setMovement(QListView.Movement.Static)
+        self.media_list.setUniformItemSizes(True)
+        self.media_list.setLayoutMode(QListView.LayoutMode.Batched)
+        self.media_list.setBatchSize(1000)
+        self.media_list.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.media_list.setSelectionMode(QListView.SelectionMode.ExtendedSelection)
+        self.media_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.media_list.customContextMenuRequested.connect(self.show_media_context_menu)
+        self.media_list.activated.connect(self.open_media)
+        main_layout.addWidget(self.media_list)
+
+        # Окно запрошенных миниатюр пересчитывается после прокрутки, изменения размера и вставки строк
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(15)
+        self.prefetch_timer.timeout.connect(self.prefetch_thumbnails)
+        self.media_list.verticalScrollBar().valueChanged.connect(self.schedule_prefetch)
+        self.media_model.rowsInserted.connect(self.schedule_prefetch)
+        self.media_model.rowsRemoved.connect(self.schedule_prefetch)
+        self.media_list.viewport().installEventFilter(self)
 
         # Добавляем кнопку для добавления медиафайлов
         button_layout = QHBoxLayout()
         add_button = QPushButton("Добавить Фото/Видео", self)
         add_button.clicked.connect(self.add_media)
         button_layout.addWidget(add_button)
+        import_button = QPushButton("Импорт папки", self)
+        import_button.clicked.connect(self.import_folder)
+        button_layout.addWidget(import_button)
+        duplicates_button = QPushButton("Дубликаты", self)
+        duplicates_button.clicked.connect(self.show_duplicates)
+        button_layout.addWidget(duplicates_button)
+        self.sort_box = QComboBox(self)
+        self.sort_box.addItems(["Сначала новые", "Сначала старые"])
+        self.sort_box.currentIndexChanged.connect(self.load_catalog)
+        button_layout.addWidget(self.sort_box)
+        self.year_box = QComboBox(self)
+        self.year_box.currentIndexChanged.connect(self.load_catalog)
+        button_layout.addWidget(self.year_box)
+        self.import_progress = QProgressBar(self)
+        self.import_progress.hide()
+        button_layout.addWidget(self.import_progress)
+        self.cancel_import_button = QPushButton("Отмена", self)
+        self.cancel_import_button.clicked.connect(self.cancel_import)
+        self.cancel_import_button.hide()
+        button_layout.addWidget(self.cancel_import_button)
         main_layout.addLayout(button_layout)
 
-        self.layout = scroll_area_layout
+        # Для импорта свой пул (по потоку на ядро), чтобы отмена не задевала другие фоновые задачи
+        self.import_pool = QThreadPool(self)
+        self.import_pool.setMaxThreadCount(os.cpu_count() or QThreadPool.globalInstance().maxThreadCount())
+        self.scanner = None
+        self.import_cancelled = threading.Event()
+        self.import_pending = set()
+        self.import_found = 0
+        self.import_done = 0
 
         # Добавляем контекстное меню для каждого элемента
         self.media_context_menu = QMenu(self)
         delete_action = QAction("Удалить", self)
         delete_action.triggered.connect(self.delete_media)
         self.media_context_menu.addAction(delete_action)
+        similar_action = QAction("Найти похожие", self)
+        similar_action.triggered.connect(self.find_similar)
+        self.media_context_menu.addAction(similar_action)
+
+        # Сетка сразу строится из каталога, а сверка с диском идёт уже после показа окна
+        self.refresh_years()
+        self.load_catalog()
+        QTimer.singleShot(0, self.reconcile_catalog)
+
+    def refresh_years(self):
+        self.catalog.flush()
+        selected = self.year_box.currentData()
+        self.year_box.blockSignals(True)
+        self.year_box.clear()
+        self.year_box.addItem("Все годы", None)
+        for year in self.catalog.years():
+            self.year_box.addItem(str(year), year)
+        index = self.year_box.findData(selected)
+        self.year_box.setCurrentIndex(max(0, index))
+        self.year_box.blockSignals(False)
+
+    def load_catalog(self, *args):
+        self.catalog.flush()
+        year = self.year_box.currentData()
+        start, end = year_range(year) if year is not None else (None, None)
+        self.media_model.set_items(self.catalog.items(self.sort_box.currentIndex() == 0, start, end))
+        self.thumbnail_window = (0, -1)
+        self.schedule_prefetch()
+
+    def reconcile_catalog(self):
+        folders = self.catalog.folders()
+        if folders:
+            self.start_scan(folders)
 
     def add_image(self, image_path):
-        item = QListWidgetItem(QIcon(image_path), "")
-        self.media_list.addItem(item)
+        # Миниатюру для видимых строк запросит prefetch_thumbnails, а эта задача занесёт файл в каталог
+        self.media_model.add_paths([image_path])
+        QThreadPool.globalInstance().start(ThumbnailTask(image_path, self.thumbnail_cache, self.thumbnail_signals, describe=True))
+
+    def eventFilter(self, obj, event):
+        if obj is self.media_list.viewport() and event.type() == QEvent.Type.Resize:
+            self.schedule_prefetch()
+        return super().eventFilter(obj, event)
+
+    def schedule_prefetch(self, *args):
+        self.prefetch_timer.start()
+
+    def visible_rows(self):
+        count = self.media_model.rowCount()
+        viewport = self.media_list.viewport()
+        columns = max(1, viewport.width() // GRID_SIZE.width())
+        line = self.media_list.verticalScrollBar().value() // GRID_SIZE.height()
+        lines = viewport.height() // GRID_SIZE.height() + 2
+        return min(line * columns, count), min((line + lines) * columns, count) - 1, lines * columns
+
+    def prefetch_thumbnails(self):
+        first, last, screen = self.visible_rows()
+        count = self.media_model.rowCount()
+        margin = screen * PREFETCH_SCREENS
+        window = (max(0, first - margin), min(count - 1, last + margin))
+        if window == self.thumbnail_window:
+            return
+        self.thumbnail_window = window
+        # Сначала видимые строки, затем запас ниже и выше
+        rows = [*range(first, last + 1), *range(last + 1, window[1] + 1), *range(first - 1, window[0] - 1, -1)]
+        paths = [self.media_model.paths[row] for row in rows]
+        self.thumbnail_wanted = set(paths)
+        # Ещё не начатые запросы для строк, ушедших из окна, снимаются
+        for path in list(self.thumbnail_requests):
+            if path not in self.thumbnail_wanted:
+                self.thumbnail_requests.pop(path).set()
+        visible = set(paths[:last - first + 1])
+        pool = QThreadPool.globalInstance()
+        for path in paths:
+            if path in self.thumbnail_memory or path in self.thumbnail_requests:
+                continue
+            cancelled = threading.Event()
+            self.thumbnail_requests[path] = cancelled
+            pool.start(ThumbnailTask(path, self.thumbnail_cache, self.thumbnail_signals, cancelled), 1 if path in visible else 0)
+        self.thumbnail_memory.evict(self.thumbnail_wanted)
+
+    def on_video_thumbnail_missing(self, path, cancelled):
+        # Видимые видео обгоняют очередь импорта
+        self.video_thumbnailer.request(path, cancelled, urgent=path in self.thumbnail_wanted)
+
+    def on_thumbnail_ready(self, path, image, metadata):
+        self.media_model.set_dimensions(path, metadata['width'], metadata['height'])
+        if 'dhash' in metadata:
+            self.image_hashes.add(path, metadata['mtime'], metadata['size'], metadata['dhash'])
+            self.metadata_flush_timer.start()
+        if 'thumbnail' in metadata:
+            self.catalog.add(path, metadata)
+            self.metadata_flush_timer.start()
+        # Миниатюры, построенные импортом для строк вне окна просмотра, в памяти не держим
+        if path in self.thumbnail_wanted:
+            self.thumbnail_memory.put(path, QPixmap.fromImage(image), self.thumbnail_wanted)
+            self.media_model.refresh(*self.thumbnail_window)
+
+    def on_thumbnail_failed(self, path, metadata):
+        self.catalog.add(path, metadata)
+        self.metadata_flush_timer.start()
+
+    def import_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Импорт папки")
+        if folder:
+            self.start_import(folder)
+
+    def start_import(self, folder, recursive=True):
+        folder = os.path.abspath(folder)
+        self.catalog.add_folder(folder, recursive)
+        self.start_scan([(folder, recursive)])
+
+    def start_scan(self, folders):
+        self.cancel_import()
+        self.import_cancelled = threading.Event()
+        self.import_pending = set()
+        self.import_found = 0
+        self.import_done = 0
+        self.import_progress.setRange(0, 0)
+        self.import_progress.show()
+        self.cancel_import_button.show()
+        # Уже известные каталогу и не изменившиеся файлы повторно не обрабатываются
+        self.catalog.flush()
+        scanner = FolderScanner(folders, self.catalog.snapshot)
+        # Сигналы уже отменённого обхода могут ещё прийти из очереди - их отбрасываем
+        scanner.found.connect(lambda paths, scanner=scanner: self.on_files_found(scanner, paths))
+        scanner.missing.connect(lambda paths, scanner=scanner: self.on_files_missing(scanner, paths))
+        scanner.finished.connect(lambda scanner=scanner: self.on_scan_finished(scanner))
+        self.scanner = scanner
+        scanner.start()
+
+    def on_files_found(self, scanner, paths):
+        if scanner is not self.scanner:
+            return
+        self.media_model.add_paths(paths)
+        for path in paths:
+            self.import_pending.add(path)
+            self.import_pool.start(ThumbnailTask(path, self.thumbnail_cache, self.thumbnail_signals, self.import_cancelled, describe=True))
+        self.import_found += len(paths)
+        self.update_import_progress()
+
+    def on_files_missing(self, scanner, paths):
+        if scanner is not self.scanner:
+            return
+        self.catalog.remove(paths)
+        self.media_model.remove_paths(paths)
+        self.thumbnail_window = (0, -1)
+
+    def on_scan_finished(self, scanner):
+        if scanner is not self.scanner:
+            return
+        self.scanner = None
+        self.update_import_progress()
+
+    def on_thumbnail_done(self, path):
+        self.thumbnail_requests.pop(path, None)
+        if path in self.import_pending:
+            self.import_pending.discard(path)
+            self.import_done += 1
+            self.update_import_progress()
+
+    def update_import_progress(self):
+        if self.scanner is None and not self.import_pending:
+            self.import_progress.hide()
+            self.cancel_import_button.hide()
+            self.refresh_years()
+            return
+        # Пока обход идёт, общее число файлов неизвестно - показываем найденное на данный момент
+        self.import_progress.setRange(0, max(self.import_found, 1))
+        self.import_progress.setValue(self.import_done)
+        self.import_progress.setFormat(f"{self.import_done} / {self.import_found}" + ("+" if self.scanner else ""))
+
+    def cancel_import(self):
+        self.import_cancelled.set()
+        if self.scanner is not None:
+            self.scanner.cancel()
+            self.scanner = None
+        self.import_pool.clear()
+        self.import_pending.clear()
+        self.update_import_progress()
 
     def add_video(self, video_path):
-        item = QListWidgetItem(QIcon('path_to_video_icon.png'), "")
-        self.media_list.addItem(item)
+        self.add_image(video_path)
 
     def add_media(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Выбрать Фото или Видео", "", "Images (*.png *.xpm *.jpg);;Videos (*.mp4 *.avi *.mkv)")
         if file_path:
-            if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
+            if file_path.lower().endswith(IMAGE_EXTENSIONS):
                 self.add_image(file_path)
-            elif file_path.lower().endswith(('.mp4', '.avi', '.mkv')):
+            elif file_path.lower().endswith(VIDEO_EXTENSIONS):
                 self.add_video(file_path)
 
     def show_media_context_menu(self, pos):
-        widget = self.sender()
-        if widget:
-            self.media_context_menu.exec(widget.mapToGlobal(pos))
+        if self.media_list.indexAt(pos).isValid():
+            self.media_context_menu.exec(self.media_list.viewport().mapToGlobal(pos))
+
+    def open_media(self, index):
+        path = self.media_model.paths[index.row()]
+        if path.lower().endswith(VIDEO_EXTENSIONS):
+            viewer = VideoWidget(path, self)
+            viewer.setWindowFlag(Qt.WindowType.Window)
+            viewer.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+            viewer.resize(800, 600)
+        else:
+            paths = [item for item in self.media_model.paths if not item.lower().endswith(VIDEO_EXTENSIONS)]
+            viewer = ImageViewer(path, self, paths, self.image_prefetcher)
+        viewer.show()
+
+    def find_similar(self):
+        index = self.media_list.currentIndex()
+        if not index.isValid():
+            return
+        matches = self.image_hashes.similar_to(self.media_model.paths[index.row()], paths=self.media_model.path_set)
+        self.select_paths([path for _, path in matches])
+        self.statusBar().showMessage(f"Похожих фото: {max(0, len(matches) - 1)}", 5000)
+
+    def show_duplicates(self):
+        groups = self.image_hashes.duplicate_groups(self.media_model.paths)
+        dialog = DuplicatesDialog(groups, self)
+        dialog.path_activated.connect(lambda path: self.select_paths([path]))
+        dialog.exec()
+
+    def select_paths(self, paths):
+        wanted = set(paths)
+        selection = QItemSelection()
+        for row, path in enumerate(self.media_model.paths):
+            if path in wanted:
+                index = self.media_model.index(row)
+                selection.select(index, index)
+        self.media_list.selectionModel().select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)
+        if not selection.isEmpty():
+            self.media_list.scrollTo(selection.indexes()[0])
+
+    def closeEvent(self, event):
+        self.cancel_import()
+        self.image_hashes.close()
+        self.catalog.close()
+        super().closeEvent(event)
 
     def delete_media(self):
-        widget = self.sender()
-        if widget:
-            self.layout.removeWidget(widget)
-            widget.deleteLater()
+        rows = [index.row() for index in self.media_list.selectionModel().selectedIndexes()]
+        # Файл остаётся на диске, поэтому в каталоге он скрывается, а не удаляется - иначе сверка вернёт его
+        self.catalog.hide([self.media_model.paths[row] for row in rows])
+        self.media_model.remove_rows(rows)
+        self.thumbnail_window = (0, -1)
+
+def benchmark_blur(image_path=None, rounds=50):
+    # Сравнение с QGraphicsBlurEffect: он размывает заново при каждой отрисовке виджета,
+    # движок - один раз на размер, дальше берёт готовый пиксмап из кэша
+    if image_path:
+        image = QImage(image_path)
+    else:
+        image = QImage(1920, 1080, QImage.Format.Format_ARGB32_Premultiplied)
+        image.fill(QColor(90, 140, 200))
+        painter = QPainter(image)
+        for i in range(0, 1920, 40):
+            painter.fillRect(i, (i * 7) % 1000, 30, 80, QColor(255, i % 255, 0))
+        painter.end()
+    size = image.size()
+    label = QLabel()
+    label.setPixmap(QPixmap.fromImage(image))
+    label.resize(size)
+    effect = QGraphicsBlurEffect()
+    effect.setBlurRadius(BLUR_RADIUS)
+    label.setGraphicsEffect(effect)
+    cases = {
+        'QGraphicsBlurEffect (repaint)': lambda: label.grab(),
+        'numpy blur (cold)': lambda: QPixmap.fromImage(blur_image(image, size)),
+        'numpy blur (cached)': lambda: blur_cache.pixmap(image, size),
+    }
+    for name, run in cases.items():
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"{name}: median {timings[len(timings) // 2]:.3f} ms, p95 {timings[int(len(timings) * 0.95)]:.3f} ms")
+
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench-blur':
+        app = QApplication(sys.argv)
+        benchmark_blur(sys.argv[2] if len(sys.argv) > 2 else None)
+        sys.exit(0)
     app = QApplication(sys.argv)
     window = GalleryApp()
     window.show()
@@ -1,9 +1,25 @@
 import sys
 import os
+import difflib
+import hashlib
+import json
+import mmap
+import queue
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QLineEdit, QPushButton, QTextEdit,
-                             QListWidget, QHBoxLayout, QListWidgetItem, QColorDialog, QFontDialog, QMenuBar, QMenu)
-from PyQt6.QtGui import QColor, QPalette, QFont, QAction
-from PyQt6.QtCore import Qt, QPropertyAnimation, QRect
+                             QListView, QHBoxLayout, QColorDialog, QFontDialog, QMenuBar, QMenu,
+                             QInputDialog, QMessageBox, QPlainTextEdit, QLabel, QDialog, QListWidget)
+from PyQt6.QtGui import QColor, QPalette, QFont, QAction, QTextCursor
+from PyQt6.QtCore import (Qt, QPropertyAnimation, QRect, QAbstractListModel, QModelIndex, QObject, QRunnable,
+                          QThreadPool, QTimer, pyqtSignal)
 import speech_recognition as sr
 from packaging.version import Version
 
@@ -21,7 +37,7 @@ def get_neumorphism_style():
         border-radius: 15px;
         color: white;
     }}
-    QLineEdit, QTextEdit, QListWidget, QPushButton {{
+    QLineEdit, QTextEdit, QListView, QPushButton {{
         background-color: rgba({BACKGROUND_COLOR.red()}, {BACKGROUND_COLOR.green()}, {BACKGROUND_COLOR.blue()}, 200);
         border-radius: 15px;
         padding: 10px;
@@ -44,16 +60,846 @@ def get_neumorphism_style():
         box-shadow: inset 10px 10px 20px rgb({SHADOW_COLOR_DARK.red()}, {SHADOW_COLOR_DARK.green()}, {SHADOW_COLOR_DARK.blue()}), 
                     inset -10px -10px 20px rgb({SHADOW_COLOR_LIGHT.red()}, {SHADOW_COLOR_LIGHT.green()}, {SHADOW_COLOR_LIGHT.blue()});
     }}
-    QListWidget {{
+    QListView {{
         border: 1px solid rgb({ACCENT_COLOR.red()}, {ACCENT_COLOR.green()}, {ACCENT_COLOR.blue()});
     }}
     """
 
+# Хранилище заметок: отдельная папка и индекс (название, путь, время изменения, размер) в SQLite.
+# Индекс обновляется по одной строке при сохранении, переименовании и удалении
+NOTES_DIR = os.path.join(os.path.expanduser('~'), 'NeumorphismNotes')
+INDEX_FILE = 'index.sqlite'
+FORBIDDEN_CHARS = '/\\:*?"<>|'
+
+
+SEARCH_LIMIT = 200
+AUTOSAVE_DELAY_MS = 1000
+# Заметки больше этого размера открываются в режиме больших документов и не индексируются по тексту
+LARGE_NOTE_SIZE = 4 * 1024 * 1024
+LARGE_BLOCK_SIZE = 1024 * 1024
+WORD_RE = re.compile(r'\w+')
+
+
+def note_file_name(title):
+    return "".join('_' if c in FORBIDDEN_CHARS else c for c in title) + '.txt'
+
+
+def normalize_for_search(text):
+    # unicode61 сам приводит регистр, но "ё" и "е" для него разные буквы
+    return text.lower().replace('ё', 'е')
+
+
+class NotesStore:
+    def __init__(self, directory=NOTES_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        # Сохранение идёт из потока автосохранения, поэтому у каждого потока своё соединение (WAL)
+        self.local = threading.local()
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS notes (
+                title TEXT PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        # Полнотекстовый (инвертированный) индекс по заголовкам и текстам, rowid совпадает с notes.rowid.
+        # Хранится в том же файле, поэтому при запуске ничего заново не токенизируется
+        has_search_index = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'").fetchone() is not None
+        self.db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts
+            USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 0')
+        """)
+        self.history = NoteHistory(self)
+        self.db.commit()
+        self.reconcile()
+        if not has_search_index:
+            self.rebuild_search_index()
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.index_path, timeout=30)
+            db.execute("PRAGMA journal_mode = WAL")
+            self.local.db = db
+        return db
+
+    def index_note(self, title, text):
+        rowid = self.db.execute("SELECT rowid FROM notes WHERE title = ?", (title,)).fetchone()[0]
+        self.db.execute("DELETE FROM notes_fts WHERE rowid = ?", (rowid,))
+        self.db.execute("INSERT INTO notes_fts (rowid, title, body) VALUES (?, ?, ?)",
+                        (rowid, normalize_for_search(title), normalize_for_search(text)))
+
+    def rebuild_search_index(self):
+        self.db.execute("DELETE FROM notes_fts")
+        for title in self.titles():
+            try:
+                self.index_note(title, self.indexable_text(self.path(title)))
+            except OSError:
+                pass
+        self.db.commit()
+
+    def indexable_text(self, path):
+        if os.path.getsize(path) > LARGE_NOTE_SIZE:
+            return ""
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            return file.read()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        # Последнее (недопечатанное) слово ищется как префикс, остальные - целиком;
+        # ранжирование bm25, заголовок весит больше текста
+        words = WORD_RE.findall(normalize_for_search(query))
+        if not words:
+            return []
+        match = " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+        return [title for title, in self.db.execute("""
+            SELECT notes.title FROM notes_fts JOIN notes ON notes.rowid = notes_fts.rowid
+            WHERE notes_fts MATCH ? ORDER BY bm25(notes_fts, 10.0, 1.0) LIMIT ?
+        """, (match, limit))]
+
+    def reconcile(self):
+        # Один проход по своей папке при запуске: подхватываем файлы, изменённые вне приложения
+        indexed = {path: (title, mtime, size) for title, path, mtime, size
+                   in self.db.execute("SELECT title, path, mtime, size FROM notes")}
+        found = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') and entry.name.endswith('.tmp'):
+                    # Остаток записи, прерванной падением процесса
+                    os.remove(entry.path)
+                    continue
+                if not entry.is_file() or not entry.name.endswith('.txt'):
+                    continue
+                found.add(entry.name)
+                stat = entry.stat()
+                known = indexed.get(entry.name)
+                if known is None:
+                    title = entry.name[:-4]
+                    self.upsert(title, entry.name, stat)
+                elif known[1:] != (stat.st_mtime, stat.st_size):
+                    title = known[0]
+                    self.upsert(title, entry.name, stat)
+                else:
+                    continue
+                self.index_note(title, self.indexable_text(entry.path))
+        for path in indexed.keys() - found:
+            self.remove_row("path", path)
+        self.db.commit()
+
+    def upsert(self, title, path, stat):
+        # UPSERT, а не INSERT OR REPLACE: rowid должен сохраняться, на нём держится поисковый индекс
+        self.db.execute("""
+            INSERT INTO notes (title, path, mtime, size) VALUES (?, ?, ?, ?)
+            ON CONFLICT(title) DO UPDATE SET path = excluded.path, mtime = excluded.mtime, size = excluded.size
+        """, (title, path, stat.st_mtime, stat.st_size))
+
+    def remove_row(self, column, value):
+        row = self.db.execute(f"SELECT rowid FROM notes WHERE {column} = ?", (value,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM notes_fts WHERE rowid = ?", (row[0],))
+            self.db.execute("DELETE FROM notes WHERE rowid = ?", (row[0],))
+
+    def titles(self):
+        return [title for title, in self.db.execute("SELECT title FROM notes ORDER BY title")]
+
+    def exists(self, title):
+        return self.db.execute("SELECT 1 FROM notes WHERE title = ?", (title,)).fetchone() is not None
+
+    def size(self, title):
+        row = self.db.execute("SELECT size FROM notes WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else 0
+
+    def touch(self, title):
+        # Файл уже записан (режим больших документов) - обновляем только строку индекса
+        path = self.path(title)
+        stat = os.stat(path)
+        with self.db:
+            self.upsert(title, os.path.basename(path), stat)
+            self.index_note(title, "")
+
+    def path(self, title):
+        row = self.db.execute("SELECT path FROM notes WHERE title = ?", (title,)).fetchone()
+        return os.path.join(self.directory, row[0] if row else note_file_name(title))
+
+    def read(self, title):
+        with open(self.path(title), 'r', encoding='utf-8') as file:
+            return file.read()
+
+    def free_file_name(self, title):
+        # Разные заголовки могут дать одно имя файла ("a/b" и "a_b"), чужой файл затирать нельзя
+        base = note_file_name(title)[:-4]
+        name, number = base + '.txt', 1
+        while os.path.exists(os.path.join(self.directory, name)):
+            number += 1
+            name = f"{base} ({number}).txt"
+        return name
+
+    def save(self, title, text):
+        # Возвращает True, если заметка новая и её нужно добавить в список
+        row = self.db.execute("SELECT path FROM notes WHERE title = ?", (title,)).fetchone()
+        is_new = row is None
+        path = os.path.join(self.directory, self.free_file_name(title) if is_new else row[0])
+        self.write_atomic(path, text)
+        stat = os.stat(path)
+        # Ошибка посреди обновления индекса откатывает транзакцию, иначе соединение потока
+        # автосохранения так и держит её открытой, и все остальные получают "database is locked"
+        with self.db:
+            self.upsert(title, os.path.basename(path), stat)
+            self.index_note(title, text)
+            self.history.record(title, text)
+        return is_new
+
+    def write_atomic(self, path, text):
+        # Пишем во временный файл рядом и подменяем им заметку: при падении старая версия остаётся целой
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def rename(self, old_title, new_title):
+        if self.exists(new_title):
+            raise FileExistsError(f"Заметка «{new_title}» уже есть")
+        new_name = self.free_file_name(new_title)
+        new_path = os.path.join(self.directory, new_name)
+        old_path = self.path(old_title)
+        os.rename(old_path, new_path)
+        try:
+            with self.db:
+                self.db.execute("UPDATE notes SET title = ?, path = ? WHERE title = ?",
+                                (new_title, new_name, old_title))
+                self.db.execute("UPDATE notes_fts SET title = ? WHERE rowid = (SELECT rowid FROM notes WHERE title = ?)",
+                                (normalize_for_search(new_title), new_title))
+                self.history.rename(old_title, new_title)
+        except sqlite3.Error:
+            os.rename(new_path, old_path)
+            raise
+
+    def delete(self, title):
+        # Сначала индекс: если он не обновится, файл заметки останется на месте
+        path = self.path(title)
+        with self.db:
+            self.remove_row("title", title)
+            self.history.delete(title)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# История версий: текст режется на куски по границам строк, граница определяется содержимым строки
+# (crc32), поэтому правка затрагивает только свой кусок. Куски хранятся сжатыми по sha256, ревизия -
+# это сжатый список номеров кусков, так что повторное сохранение большой заметки стоит лишь изменённых байт
+CHUNK_MIN = 1024
+CHUNK_MAX = 16384
+CHUNK_MASK = 0x3F
+
+
+def chunk_text(text):
+    chunks = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > CHUNK_MAX:
+            if current:
+                chunks.append("".join(current))
+                current, size = [], 0
+            chunks.append(line[:CHUNK_MAX])
+            line = line[CHUNK_MAX:]
+        current.append(line)
+        size += len(line)
+        if size >= CHUNK_MAX or (size >= CHUNK_MIN and zlib.crc32(line.encode('utf-8')) & CHUNK_MASK == 0):
+            chunks.append("".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+class NoteHistory:
+    def __init__(self, store):
+        self.store = store
+        db = store.db
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                hash BLOB NOT NULL UNIQUE,
+                data BLOB NOT NULL
+            )
+        """)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS revisions (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                created REAL NOT NULL,
+                size INTEGER NOT NULL,
+                digest BLOB NOT NULL,
+                manifest BLOB NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS revisions_title ON revisions (title, id)")
+
+    def record(self, title, text):
+        db = self.store.db
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).digest()
+        last = db.execute("SELECT digest FROM revisions WHERE title = ? ORDER BY id DESC LIMIT 1", (title,)).fetchone()
+        if last is not None and last[0] == digest:
+            return None
+        ids = array('I')
+        for chunk in chunk_text(text):
+            chunk_data = chunk.encode('utf-8')
+            chunk_hash = hashlib.sha256(chunk_data).digest()
+            row = db.execute("SELECT id FROM chunks WHERE hash = ?", (chunk_hash,)).fetchone()
+            if row is None:
+                row = (db.execute("INSERT INTO chunks (hash, data) VALUES (?, ?)",
+                                  (chunk_hash, zlib.compress(chunk_data))).lastrowid,)
+            ids.append(row[0])
+        cursor = db.execute("INSERT INTO revisions (title, created, size, digest, manifest) VALUES (?, ?, ?, ?, ?)",
+                            (title, time.time(), len(data), digest, zlib.compress(ids.tobytes())))
+        return cursor.lastrowid
+
+    def revisions(self, title):
+        return self.store.db.execute(
+            "SELECT id, created, size FROM revisions WHERE title = ? ORDER BY id DESC", (title,)).fetchall()
+
+    def chunk_ids(self, revision_id):
+        row = self.store.db.execute("SELECT manifest FROM revisions WHERE id = ?", (revision_id,)).fetchone()
+        ids = array('I')
+        ids.frombytes(zlib.decompress(row[0]))
+        return ids
+
+    def chunks(self, revision_id):
+        ids = self.chunk_ids(revision_id)
+        data = dict(self.store.db.execute(
+            f"SELECT id, data FROM chunks WHERE id IN ({','.join('?' * len(set(ids)))})", list(set(ids))))
+        return [zlib.decompress(data[chunk_id]).decode('utf-8') for chunk_id in ids]
+
+    def text(self, revision_id):
+        return "".join(self.chunks(revision_id))
+
+    def diff(self, revision_id, text):
+        # Совпадающие куски в начале и в конце пропускаем целиком, построчно сравнивается только середина
+        old, new = self.chunks(revision_id), chunk_text(text)
+        prefix = 0
+        while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(old), len(new)) - prefix
+               and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]):
+            suffix += 1
+        old_lines = "".join(old[prefix:len(old) - suffix]).splitlines(keepends=True)
+        new_lines = "".join(new[prefix:len(new) - suffix]).splitlines(keepends=True)
+        return "".join(difflib.unified_diff(old_lines, new_lines, 'версия', 'текущий текст'))
+
+    def rename(self, old_title, new_title):
+        self.store.db.execute("UPDATE revisions SET title = ? WHERE title = ?", (new_title, old_title))
+
+    def delete(self, title):
+        db = self.store.db
+        db.execute("DELETE FROM revisions WHERE title = ?", (title,))
+        # Удаляем куски, на которые больше не ссылается ни одна ревизия
+        used = set()
+        for revision_id, in db.execute("SELECT id FROM revisions").fetchall():
+            used.update(self.chunk_ids(revision_id))
+        unused = [(chunk_id,) for chunk_id, in db.execute("SELECT id FROM chunks") if chunk_id not in used]
+        db.executemany("DELETE FROM chunks WHERE id = ?", unused)
+
+
+# Список заметок как модель: представление запрашивает данные только для видимых строк,
+# а тексты заметок читаются лишь при выборе (с небольшим LRU-кэшем и подгрузкой соседей в фоне)
+BODY_CACHE_SIZE = 32
+PREFETCH_NEIGHBOURS = 2
+
+
+class NotesListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.titles = []
+        self.sorted = True
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.titles)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self.titles[index.row()]
+        return None
+
+    def set_titles(self, titles, sorted=True):
+        self.beginResetModel()
+        self.titles = list(titles)
+        self.sorted = sorted
+        self.endResetModel()
+
+    def title(self, row):
+        return self.titles[row]
+
+    def add_title(self, title):
+        row = bisect_left(self.titles, title) if self.sorted else len(self.titles)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.titles.insert(row, title)
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.titles[row]
+        self.endRemoveRows()
+
+    def rename_row(self, row, title):
+        # Строка переносится через beginMoveRows: текущий индекс списка остаётся на переименованной заметке
+        if self.sorted:
+            position = bisect_left(self.titles[:row] + self.titles[row + 1:], title)
+            destination = position if position <= row else position + 1
+            if destination not in (row, row + 1):
+                self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+                del self.titles[row]
+                self.titles.insert(position, title)
+                self.endMoveRows()
+                row = position
+        self.titles[row] = title
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+
+class NoteBodyCache:
+    def __init__(self, capacity=BODY_CACHE_SIZE):
+        self.capacity = capacity
+        self.bodies = OrderedDict()
+
+    def __contains__(self, title):
+        return title in self.bodies
+
+    def get(self, title):
+        text = self.bodies.get(title)
+        if text is not None:
+            self.bodies.move_to_end(title)
+        return text
+
+    def put(self, title, text):
+        self.bodies[title] = text
+        self.bodies.move_to_end(title)
+        while len(self.bodies) > self.capacity:
+            self.bodies.popitem(last=False)
+
+    def pop(self, title):
+        return self.bodies.pop(title, None)
+
+
+class NoteLoaderSignals(QObject):
+    loaded = pyqtSignal(str, str)
+    done = pyqtSignal(str)
+
+
+class NotePrefetchTask(QRunnable):
+    def __init__(self, title, path, signals):
+        super().__init__()
+        self.title = title
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        # done отправляется всегда, иначе заголовок навсегда остался бы в NotesApp.prefetching
+        try:
+            if os.path.getsize(self.path) <= LARGE_NOTE_SIZE:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    self.signals.loaded.emit(self.title, file.read())
+        except OSError:
+            pass
+        finally:
+            self.signals.done.emit(self.title)
+
+
+# Режим больших документов: файл отображается через mmap и делится на блоки ~1 МБ по границам строк.
+# В редакторе (QPlainTextEdit, без rich text) открыт один блок. При сохранении изменённые блоки пишутся
+# из памяти, а неизменённые диапазоны копируются ядром (copy_file_range) во временный файл
+class LargeDocument:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.modified = {}
+        self.file = None
+        self.map = None
+        self.open()
+        self.blocks = self.split()
+
+    def open(self):
+        self.file = open(self.path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def rename(self, path):
+        # Файл переименован на диске; открытый дескриптор и mmap остаются действительными
+        with self.lock:
+            self.path = path
+
+    def split(self):
+        blocks = []
+        pos = 0
+        while pos < self.size:
+            end = self.map.find(b'\n', min(pos + LARGE_BLOCK_SIZE, self.size) - 1)
+            end = self.size if end == -1 else end + 1
+            blocks.append((pos, end - pos))
+            pos = end
+        return blocks or [(0, 0)]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def block_text(self, index):
+        if index in self.modified:
+            return self.modified[index]
+        with self.lock:
+            offset, length = self.blocks[index]
+            if self.map is None:
+                return ""
+            return self.map[offset:offset + length].decode('utf-8', errors='replace')
+
+    def copy_range(self, output, offset, length):
+        try:
+            while length:
+                copied = os.copy_file_range(self.file.fileno(), output.fileno(), length, offset)
+                if not copied:
+                    break
+                offset += copied
+                length -= copied
+        except (AttributeError, OSError):
+            pass
+        for start in range(offset, offset + length, LARGE_BLOCK_SIZE):
+            output.write(self.map[start:min(start + LARGE_BLOCK_SIZE, offset + length)])
+
+    def save(self, modified):
+        with self.lock:
+            lengths = []
+            fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.tmp', dir=os.path.dirname(self.path))
+            try:
+                with os.fdopen(fd, 'wb', buffering=0) as output:
+                    for index, (offset, length) in enumerate(self.blocks):
+                        if index in modified:
+                            data = modified[index].encode('utf-8')
+                            output.write(data)
+                            lengths.append(len(data))
+                        else:
+                            self.copy_range(output, offset, length)
+                            lengths.append(length)
+                    os.fsync(output.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            # Границы блоков сохраняются, меняются только смещения - открытый в редакторе блок остаётся тем же
+            self.close()
+            self.open()
+            self.blocks = []
+            offset = 0
+            for length in lengths:
+                self.blocks.append((offset, length))
+                offset += length
+        for index, text in modified.items():
+            if self.modified.get(index) is text:
+                del self.modified[index]
+
+
+# Автосохранение: GUI только кладёт последний текст заметки в очередь, запись идёт в отдельном потоке.
+# Несколько правок одной заметки, накопившихся до записи, превращаются в одну запись
+class AutosaveWorker(QObject):
+    saved = pyqtSignal(str, bool)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.pending = {}
+        self.busy = False
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, title, text):
+        with self.condition:
+            self.pending[title] = text
+            self.condition.notify_all()
+
+    def flush(self):
+        with self.condition:
+            while self.pending or self.busy:
+                self.condition.wait()
+
+    def stop(self):
+        self.flush()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                title = next(iter(self.pending))
+                text = self.pending.pop(title)
+                self.busy = True
+            try:
+                if isinstance(text, str):
+                    self.saved.emit(title, self.store.save(title, text))
+                else:
+                    document, modified = text
+                    document.save(modified)
+                    self.store.touch(title)
+                    self.saved.emit(title, False)
+            except Exception as e:
+                self.failed.emit(title, str(e))
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+
+# Голосовой ввод: поток захвата читает куски звука с микрофона в очередь, поток распознавания отдаёт их
+# движку и присылает промежуточные и окончательные гипотезы сигналами. По умолчанию движок офлайновый (Vosk)
+VOICE_SAMPLE_RATE = 16000
+VOICE_BACKEND = os.environ.get('NOTES_VOICE_BACKEND', 'vosk')
+_vosk_models = {}
+
+
+class VoskBackend:
+    def __init__(self, sample_rate):
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("Для офлайн-распознавания установите пакет vosk")
+        # Модель берётся только из локальной папки: vosk.Model(lang=...) молча скачивает её из сети
+        model_path = os.environ.get('VOSK_MODEL_PATH')
+        if not model_path or not os.path.isdir(model_path):
+            raise RuntimeError("Укажите в переменной VOSK_MODEL_PATH папку с распакованной моделью Vosk "
+                               "(например, vosk-model-small-ru с https://alphacephei.com/vosk/models)")
+        if model_path not in _vosk_models:
+            _vosk_models[model_path] = vosk.Model(model_path)
+        self.recognizer = vosk.KaldiRecognizer(_vosk_models[model_path], sample_rate)
+
+    def accept(self, chunk):
+        # Возвращает (промежуточная гипотеза, окончательная фраза)
+        if self.recognizer.AcceptWaveform(chunk):
+            return None, json.loads(self.recognizer.Result()).get('text', '')
+        return json.loads(self.recognizer.PartialResult()).get('partial', ''), None
+
+    def finish(self):
+        return json.loads(self.recognizer.FinalResult()).get('text', '')
+
+
+class GoogleBackend:
+    # Онлайн-распознавание: промежуточных гипотез нет, вся фраза отправляется после остановки
+    def __init__(self, sample_rate, sample_width=2):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.chunks = []
+
+    def accept(self, chunk):
+        self.chunks.append(chunk)
+        return None, None
+
+    def finish(self):
+        audio = sr.AudioData(b"".join(self.chunks), self.sample_rate, self.sample_width)
+        try:
+            return sr.Recognizer().recognize_google(audio, language="ru-RU")
+        except sr.UnknownValueError:
+            return ""
+        except sr.RequestError as e:
+            raise RuntimeError(f"Не удалось запросить результаты у Google Speech Recognition; {e}")
+
+
+class FakeBackend:
+    # Для тестов: на каждый кусок звука выдаёт следующую заготовленную гипотезу
+    def __init__(self, sample_rate, hypotheses=("тестовая", "тестовая заметка")):
+        self.hypotheses = list(hypotheses)
+        self.position = 0
+
+    def accept(self, chunk):
+        if self.position < len(self.hypotheses):
+            self.position += 1
+            return self.hypotheses[self.position - 1], None
+        return None, None
+
+    def finish(self):
+        return self.hypotheses[-1] if self.hypotheses else ""
+
+
+VOICE_BACKENDS = {
+    'vosk': VoskBackend,
+    'google': GoogleBackend,
+    'fake': FakeBackend,
+}
+
+
+class MicrophoneSource:
+    def __init__(self, sample_rate=VOICE_SAMPLE_RATE):
+        self.microphone = sr.Microphone(sample_rate=sample_rate)
+
+    def __enter__(self):
+        self.microphone.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.microphone.__exit__(*exc_info)
+
+    def read(self):
+        return self.microphone.stream.read(self.microphone.CHUNK)
+
+
+class FakeSource:
+    def __init__(self, chunks=(b"\0" * 3200,) * 3):
+        self.chunks = iter(chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def read(self):
+        return next(self.chunks, None)
+
+
+class VoiceInputWorker(QObject):
+    partial = pyqtSignal(str)
+    final = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    def __init__(self, backend_factory=None, source_factory=MicrophoneSource, sample_rate=VOICE_SAMPLE_RATE):
+        super().__init__()
+        self.backend_factory = backend_factory or VOICE_BACKENDS[VOICE_BACKEND]
+        self.source_factory = source_factory
+        self.sample_rate = sample_rate
+        self.chunks = queue.Queue()
+        self.stop_event = threading.Event()
+        self.threads = [threading.Thread(target=self.capture, daemon=True),
+                        threading.Thread(target=self.recognize, daemon=True)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def capture(self):
+        try:
+            with self.source_factory() as source:
+                while not self.stop_event.is_set():
+                    chunk = source.read()
+                    if chunk is None:
+                        break
+                    self.chunks.put(chunk)
+        except Exception as e:
+            self.failed.emit(f"Микрофон недоступен: {e}")
+        finally:
+            self.chunks.put(None)
+
+    def recognize(self):
+        try:
+            backend = self.backend_factory(self.sample_rate)
+        except Exception as e:
+            self.stop_event.set()
+            self.failed.emit(str(e))
+            backend = None
+        try:
+            while True:
+                chunk = self.chunks.get()
+                if chunk is None:
+                    break
+                if backend is None:
+                    continue
+                partial, final = backend.accept(chunk)
+                if final:
+                    self.final.emit(final)
+                elif partial:
+                    self.partial.emit(partial)
+            if backend is not None:
+                text = backend.finish()
+                if text:
+                    self.final.emit(text)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            self.finished.emit()
+
+
+class HistoryDialog(QDialog):
+    def __init__(self, history, title, current_text, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"История: {title}")
+        self.resize(700, 500)
+        self.history = history
+        self.current_text = current_text
+        self.restored_text = None
+        self.revision_ids = []
+
+        layout = QHBoxLayout(self)
+        self.revision_list = QListWidget(self)
+        for revision_id, created, size in history.revisions(title):
+            self.revision_ids.append(revision_id)
+            self.revision_list.addItem(f"{time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(created))}  ({size} Б)")
+        self.revision_list.currentRowChanged.connect(self.show_diff)
+        layout.addWidget(self.revision_list, 1)
+
+        right_layout = QVBoxLayout()
+        self.diff_view = QPlainTextEdit(self)
+        self.diff_view.setReadOnly(True)
+        self.diff_view.setFont(QFont('Courier New', 10))
+        right_layout.addWidget(self.diff_view)
+        restore_button = QPushButton("Восстановить эту версию", self)
+        restore_button.clicked.connect(self.restore)
+        right_layout.addWidget(restore_button)
+        layout.addLayout(right_layout, 2)
+
+        if self.revision_ids:
+            self.revision_list.setCurrentRow(0)
+
+    def show_diff(self, row):
+        if row < 0:
+            return
+        diff = self.history.diff(self.revision_ids[row], self.current_text)
+        self.diff_view.setPlainText(diff or "Совпадает с текущим текстом")
+
+    def restore(self):
+        row = self.revision_list.currentRow()
+        if row >= 0:
+            self.restored_text = self.history.text(self.revision_ids[row])
+            self.accept()
+
+
 class NotesApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Neumorphism Notes App')
         self.setGeometry(100, 100, 600, 400)
+
+        self.store = NotesStore()
+        self.autosave = AutosaveWorker(self.store)
+        self.autosave.saved.connect(self.on_note_saved)
+        self.autosave.failed.connect(self.on_save_failed)
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setSingleShot(True)
+        self.autosave_timer.setInterval(AUTOSAVE_DELAY_MS)
+        self.autosave_timer.timeout.connect(self.autosave_note)
         
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
@@ -61,22 +907,72 @@ class NotesApp(QMainWindow):
         self.layout = QHBoxLayout()
         self.central_widget.setLayout(self.layout)
         
-        self.notes_list = QListWidget(self)
-        self.notes_list.itemClicked.connect(self.load_note)
-        self.layout.addWidget(self.notes_list, 1)
+        self.left_widget = QWidget()
+        self.left_layout = QVBoxLayout()
+        self.left_widget.setLayout(self.left_layout)
+        self.layout.addWidget(self.left_widget, 1)
+
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText("Поиск")
+        self.search_box.textChanged.connect(self.search_notes)
+        self.left_layout.addWidget(self.search_box)
+
+        self.notes_model = NotesListModel(self)
+        self.body_cache = NoteBodyCache()
+        self.prefetching = set()
+        self.loader_signals = NoteLoaderSignals()
+        self.loader_signals.loaded.connect(self.on_body_prefetched)
+        self.loader_signals.done.connect(self.on_prefetch_done)
+
+        self.notes_list = QListView(self)
+        self.notes_list.setModel(self.notes_model)
+        self.notes_list.setUniformItemSizes(True)
+        self.notes_list.selectionModel().currentChanged.connect(self.load_note)
+        self.notes_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.notes_list.customContextMenuRequested.connect(self.show_note_menu)
+        self.left_layout.addWidget(self.notes_list)
         
         self.right_widget = QWidget()
         self.right_layout = QVBoxLayout()
         self.right_widget.setLayout(self.right_layout)
         self.layout.addWidget(self.right_widget, 2)
         
+        # Автосохранение привязано к открытой заметке (current_title), а не к тексту поля заголовка:
+        # правка заголовка применяется как переименование по Enter или при уходе фокуса
+        self.current_title = None
         self.note_title = QLineEdit(self)
         self.note_title.setPlaceholderText("Введите заголовок заметки")
+        self.note_title.editingFinished.connect(self.commit_title)
         self.right_layout.addWidget(self.note_title)
         
         self.note_text = QTextEdit(self)
         self.note_text.setPlaceholderText("Введите текст заметки")
+        self.note_text.textChanged.connect(self.autosave_timer.start)
         self.right_layout.addWidget(self.note_text)
+
+        # Редактор больших документов: простой текст, по одному блоку файла
+        self.large_document = None
+        self.large_block = 0
+        self.large_editor = QPlainTextEdit(self)
+        self.large_editor.textChanged.connect(self.autosave_timer.start)
+        self.large_editor.hide()
+        self.right_layout.addWidget(self.large_editor)
+
+        self.large_nav = QWidget()
+        large_nav_layout = QHBoxLayout()
+        large_nav_layout.setContentsMargins(0, 0, 0, 0)
+        self.large_nav.setLayout(large_nav_layout)
+        self.large_prev_button = QPushButton("◀", self)
+        self.large_prev_button.clicked.connect(lambda: self.show_large_block(self.large_block - 1))
+        self.large_block_label = QLabel(self)
+        self.large_block_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.large_next_button = QPushButton("▶", self)
+        self.large_next_button.clicked.connect(lambda: self.show_large_block(self.large_block + 1))
+        large_nav_layout.addWidget(self.large_prev_button)
+        large_nav_layout.addWidget(self.large_block_label, 1)
+        large_nav_layout.addWidget(self.large_next_button)
+        self.large_nav.hide()
+        self.right_layout.addWidget(self.large_nav)
         
         self.save_button = QPushButton("Сохранить", self)
         self.save_button.clicked.connect(self.save_note)
@@ -85,6 +981,12 @@ class NotesApp(QMainWindow):
         self.voice_button = QPushButton("Голосовой ввод", self)
         self.voice_button.clicked.connect(self.voice_input)
         self.right_layout.addWidget(self.voice_button)
+        self.voice_worker = None
+        self.voice_cursor = None
+        # Номер открытой заметки: меняется при каждой смене содержимого редактора, гипотезы,
+        # начатые на другой заметке, отбрасываются
+        self.note_generation = 0
+        self.voice_generation = 0
 
         self.load_saved_notes()
 
@@ -110,31 +1012,264 @@ class NotesApp(QMainWindow):
         self.setPalette(palette)
 
     def save_note(self):
+        if self.current_title is None:
+            # Явное сохранение новой заметки, в том числе поверх существующей с тем же заголовком
+            self.current_title = self.note_title.text() or None
+        else:
+            self.commit_title()
+        if self.large_document is not None:
+            self.note_switched()
+            self.autosave_note()
+            self.close_large_note()
+            self.current_title = None
+            self.notes_list.setCurrentIndex(QModelIndex())
+            self.note_title.clear()
+            self.autosave_timer.stop()
+            return
+        if self.current_title:
+            self.note_switched()
+            self.autosave_note()
+            self.current_title = None
+            self.notes_list.setCurrentIndex(QModelIndex())
+            self.note_title.clear()
+            self.set_note_text("")
+        self.autosave_timer.stop()
+
+    def commit_title(self):
         title = self.note_title.text()
-        text = self.note_text.toPlainText()
+        if not title or title == self.current_title:
+            return
+        if self.current_title is not None:
+            if not self.apply_rename(self.current_title, title):
+                self.note_title.setText(self.current_title)
+            return
+        # Новая заметка появляется, когда заголовок дописан; существующую так не перезаписываем
+        if not self.store.exists(title):
+            self.current_title = title
+            self.autosave_note()
+
+    def apply_rename(self, old_title, new_title):
+        try:
+            self.autosave.flush()
+            self.store.rename(old_title, new_title)
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.warning(self, 'Переименовать', f"Не удалось переименовать заметку: {e}")
+            return False
+        text = self.body_cache.pop(old_title)
+        if text is not None:
+            self.body_cache.put(new_title, text)
+        if old_title in self.notes_model.titles:
+            self.notes_model.rename_row(self.notes_model.titles.index(old_title), new_title)
+        if self.current_title == old_title:
+            self.current_title = new_title
+            self.note_title.setText(new_title)
+            if self.large_document is not None:
+                self.large_document.rename(self.store.path(new_title))
+        return True
+
+    def autosave_note(self):
+        title = self.current_title
+        if self.large_document is not None:
+            self.capture_large_block()
+            if title and self.large_document.modified:
+                self.autosave.submit(title, (self.large_document, dict(self.large_document.modified)))
+            return
         if title:
-            with open(f'{title}.txt', 'w', encoding='utf-8') as file:
-                file.write(text)
-            self.note_title.clear()
-            self.note_text.clear()
-            self.load_saved_notes()
+            text = self.note_text.toPlainText()
+            self.body_cache.put(title, text)
+            self.autosave.submit(title, text)
+
+    def on_note_saved(self, title, is_new):
+        # Во время поиска список не пересобирается (иначе сбрасываются выделение и прокрутка):
+        # строка сохранённой заметки остаётся на месте, новая дописывается, если подходит под запрос
+        query = self.search_box.text()
+        if query:
+            if title not in self.notes_model.titles and title in self.store.search(query):
+                self.notes_model.add_title(title)
+        elif is_new:
+            self.notes_model.add_title(title)
+
+    def on_save_failed(self, title, message):
+        QMessageBox.warning(self, 'Сохранение', f"Не удалось сохранить заметку «{title}»: {message}")
+
+    def set_note_text(self, text):
+        # Программная подстановка текста не должна запускать автосохранение
+        self.note_text.blockSignals(True)
+        self.note_text.setText(text)
+        self.note_text.blockSignals(False)
+
+    def note_switched(self):
+        # Запись голоса относится к заметке, на которой начата: при смене заметки она останавливается,
+        # а незаконченная гипотеза убирается из старой заметки до её автосохранения
+        if self.voice_worker is not None and self.voice_generation == self.note_generation:
+            self.replace_voice_text("")
+        self.note_generation += 1
+        if self.voice_worker is not None:
+            self.voice_worker.stop()
+            self.voice_button.setEnabled(False)
+
+    def open_large_note(self, title):
+        self.close_large_note()
+        self.large_document = LargeDocument(self.store.path(title))
+        self.note_text.hide()
+        self.voice_button.setEnabled(False)
+        self.large_editor.show()
+        self.large_nav.show()
+        self.large_block = 0
+        self.show_large_block(0, capture=False)
+
+    def close_large_note(self):
+        if self.large_document is None:
+            return
+        # Сохранение блоков из очереди автосохранения ещё читает этот файл
+        self.autosave.flush()
+        self.large_document.close()
+        self.large_document = None
+        self.large_editor.blockSignals(True)
+        self.large_editor.clear()
+        self.large_editor.blockSignals(False)
+        self.large_editor.hide()
+        self.large_nav.hide()
+        self.note_text.show()
+        self.voice_button.setEnabled(True)
+
+    def capture_large_block(self):
+        if self.large_editor.document().isModified():
+            self.large_document.modified[self.large_block] = self.large_editor.toPlainText()
+            self.large_editor.document().setModified(False)
+
+    def show_large_block(self, index, capture=True):
+        document = self.large_document
+        if document is None or not 0 <= index < len(document):
+            return
+        if capture:
+            self.capture_large_block()
+        self.large_block = index
+        self.large_editor.blockSignals(True)
+        self.large_editor.setPlainText(document.block_text(index))
+        self.large_editor.blockSignals(False)
+        self.large_editor.document().setModified(False)
+        self.large_block_label.setText(f"Блок {index + 1} / {len(document)}")
+        self.large_prev_button.setEnabled(index > 0)
+        self.large_next_button.setEnabled(index < len(document) - 1)
+
+    def closeEvent(self, event):
+        self.commit_title()
+        if self.autosave_timer.isActive():
+            self.autosave_timer.stop()
+            self.autosave_note()
+        if self.voice_worker is not None:
+            self.voice_worker.stop()
+        self.autosave.stop()
+        super().closeEvent(event)
 
     def load_saved_notes(self):
-        self.notes_list.clear()
-        for file_name in os.listdir('.'):
-            if file_name.endswith('.txt'):
-                item = QListWidgetItem(file_name[:-4])
-                self.notes_list.addItem(item)
-    
-    def load_note(self, item):
-        title = item.text()
-        with open(f'{title}.txt', 'r', encoding='utf-8') as file:
-            text = file.read()
+        self.notes_model.set_titles(self.store.titles())
+
+    def search_notes(self, query):
+        if not query.strip():
+            self.load_saved_notes()
+            return
+        # Результаты показываются в порядке релевантности, а не по алфавиту
+        self.notes_model.set_titles(self.store.search(query), sorted=False)
+
+    def load_note(self, index):
+        if not index.isValid():
+            return
+        title = self.notes_model.title(index.row())
+        self.note_switched()
+        if self.autosave_timer.isActive():
+            self.autosave_timer.stop()
+            self.autosave_note()
+        self.current_title = title
+        if self.store.size(title) > LARGE_NOTE_SIZE:
+            self.note_title.setText(title)
+            self.open_large_note(title)
+            return
+        text = self.body_cache.get(title)
+        if text is None:
+            text = self.store.read(title)
+            self.body_cache.put(title, text)
+        self.close_large_note()
         self.note_title.setText(title)
-        self.note_text.setText(text)
+        self.set_note_text(text)
+        self.prefetch_neighbours(index.row())
+
+    def prefetch_neighbours(self, row):
+        for neighbour in range(row - PREFETCH_NEIGHBOURS, row + PREFETCH_NEIGHBOURS + 1):
+            if neighbour == row or not 0 <= neighbour < self.notes_model.rowCount():
+                continue
+            title = self.notes_model.title(neighbour)
+            if title in self.body_cache or title in self.prefetching:
+                continue
+            self.prefetching.add(title)
+            QThreadPool.globalInstance().start(NotePrefetchTask(title, self.store.path(title), self.loader_signals))
+
+    def on_prefetch_done(self, title):
+        self.prefetching.discard(title)
+
+    def on_body_prefetched(self, title, text):
+        if title not in self.body_cache:
+            self.body_cache.put(title, text)
+
+    def show_note_menu(self, pos):
+        item = self.notes_list.indexAt(pos)
+        if not item.isValid():
+            return
+        menu = QMenu(self)
+        rename_action = menu.addAction('Переименовать')
+        delete_action = menu.addAction('Удалить')
+        history_action = menu.addAction('История версий')
+        action = menu.exec(self.notes_list.mapToGlobal(pos))
+        if action == rename_action:
+            self.rename_note(item)
+        elif action == delete_action:
+            self.delete_note(item)
+        elif action == history_action:
+            self.show_history(item)
+
+    def rename_note(self, item):
+        old_title = self.notes_model.title(item.row())
+        new_title, ok = QInputDialog.getText(self, 'Переименовать', 'Новый заголовок:', text=old_title)
+        if not ok or not new_title or new_title == old_title:
+            return
+        self.apply_rename(old_title, new_title)
+
+    def show_history(self, item):
+        title = self.notes_model.title(item.row())
+        if self.store.size(title) > LARGE_NOTE_SIZE:
+            QMessageBox.information(self, 'История версий', "Для больших документов история версий не ведётся")
+            return
+        self.autosave.flush()
+        if self.current_title == title and self.large_document is None:
+            current_text = self.note_text.toPlainText()
+        else:
+            current_text = self.store.read(title)
+        dialog = HistoryDialog(self.store.history, title, current_text, self)
+        if dialog.exec() and dialog.restored_text is not None:
+            # Восстановление - это обычное сохранение, поэтому оно само становится новой ревизией
+            self.autosave.submit(title, dialog.restored_text)
+            self.body_cache.put(title, dialog.restored_text)
+            if self.current_title == title:
+                self.set_note_text(dialog.restored_text)
+
+    def delete_note(self, item):
+        title = self.notes_model.title(item.row())
+        self.autosave.flush()
+        try:
+            self.store.delete(title)
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.warning(self, 'Удалить', f"Не удалось удалить заметку: {e}")
+            return
+        self.body_cache.pop(title)
+        if self.current_title == title:
+            # Отложенное автосохранение не должно воссоздать удалённую заметку
+            self.autosave_timer.stop()
+            self.current_title = None
+        self.notes_model.remove_row(item.row())
 
     def animate_widgets(self):
-        for widget in [self.notes_list, self.note_title, self.note_text, self.save_button, self.voice_button]:
+        for widget in [self.search_box, self.notes_list, self.note_title, self.note_text, self.save_button, self.voice_button]:
             anim = QPropertyAnimation(widget, b"geometry")
             anim.setDuration(1000)
             anim.setStartValue(QRect(widget.x(), widget.y(), 0, 0))
@@ -170,18 +1305,55 @@ class NotesApp(QMainWindow):
             self.note_text.setFont(font)
 
     def voice_input(self):
-        recognizer = sr.Recognizer()
-        with sr.Microphone() as source:
-            print("Скажите что-нибудь...")
-            audio = recognizer.listen(source)
-        try:
-            text = recognizer.recognize_google(audio, language="ru-RU")
-            print("Вы сказали: " + text)
-            self.note_text.append(text)
-        except sr.UnknownValueError:
-            print("Google Speech Recognition не смог распознать речь")
-        except sr.RequestError as e:
-            print("Не удалось запросить результаты у Google Speech Recognition; {0}".format(e))
+        # Кнопка работает как переключатель: первый клик начинает запись, второй останавливает
+        if self.voice_worker is not None:
+            self.voice_worker.stop()
+            self.voice_button.setEnabled(False)
+            return
+        # Гипотеза отслеживается выделением собственного курсора документа: правки пользователя
+        # в других местах заметки сдвигают этот диапазон, и заменяется только он. Конец выделения
+        # не сдвигается вставкой прямо в него - дописанное сразу за гипотезой ей не принадлежит
+        self.voice_cursor = QTextCursor(self.note_text.document())
+        self.voice_cursor.setKeepPositionOnInsert(True)
+        self.voice_cursor.movePosition(QTextCursor.MoveOperation.End)
+        self.voice_generation = self.note_generation
+        self.voice_worker = VoiceInputWorker()
+        self.voice_worker.partial.connect(self.on_voice_partial)
+        self.voice_worker.final.connect(self.on_voice_final)
+        self.voice_worker.failed.connect(self.on_voice_failed)
+        self.voice_worker.finished.connect(self.on_voice_finished)
+        self.voice_worker.start()
+        self.voice_button.setText("Остановить запись")
+
+    def replace_voice_text(self, text):
+        # Новая гипотеза заменяет предыдущую и сама становится выделением voice_cursor
+        start = self.voice_cursor.selectionStart()
+        cursor = QTextCursor(self.note_text.document())
+        cursor.setPosition(start)
+        cursor.setPosition(self.voice_cursor.selectionEnd(), QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(text)
+        self.voice_cursor.setPosition(start)
+        self.voice_cursor.setPosition(cursor.position(), QTextCursor.MoveMode.KeepAnchor)
+
+    def on_voice_partial(self, text):
+        if self.voice_generation == self.note_generation:
+            self.replace_voice_text(text)
+
+    def on_voice_final(self, text):
+        if self.voice_generation == self.note_generation:
+            self.replace_voice_text(text + " ")
+            # Окончательная фраза остаётся в тексте, следующая гипотеза пойдёт сразу за ней
+            self.voice_cursor.setPosition(self.voice_cursor.position())
+
+    def on_voice_failed(self, message):
+        QMessageBox.warning(self, 'Голосовой ввод', message)
+
+    def on_voice_finished(self):
+        if self.voice_generation == self.note_generation:
+            self.replace_voice_text("")
+        self.voice_worker = None
+        self.voice_button.setEnabled(True)
+        self.voice_button.setText("Голосовой ввод")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -1,12 +1,500 @@
 import sys
+import os
+import json
+import random
+import re
+import shutil
+import sqlite3
+import struct
+import subprocess
+import threading
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, 
                              QWidget, QPushButton, QLineEdit, QSlider, QLabel, 
-                             QHBoxLayout, QFileDialog, QGraphicsDropShadowEffect)
+                             QHBoxLayout, QFileDialog, QGraphicsDropShadowEffect,
+                             QListWidget, QListWidgetItem)
 from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PyQt6.QtMultimediaWidgets import QVideoWidget
-from PyQt6.QtCore import Qt, QUrl
+from PyQt6.QtCore import Qt, QUrl, QObject, QTimer, QStandardPaths, pyqtSignal
 from PyQt6.QtGui import QPalette, QColor
 
+# Media library: a background crawler stores per-file metadata in SQLite, search goes through
+# an FTS5 trigram index (substring and typo-tolerant matching) and an indexed normalized title
+# for one- and two-letter prefixes. Rescans only probe files whose size or mtime changed
+MEDIA_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.mkv', '.webm', '.avi', '.mp3', '.m4a', '.flac', '.ogg', '.wav')
+LIBRARY_PATH = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'), 'YouPlayer', 'library.sqlite')
+LIBRARY_BATCH_SIZE = 200
+LIBRARY_RESCAN_MS = 10 * 60 * 1000
+SEARCH_LIMIT = 50
+SHORT_WORD_CANDIDATES = 20
+
+# Playlist: "Previous" restarts the current item when it has played longer than this
+RESTART_THRESHOLD_MS = 3000
+REPEAT_LABELS = {'off': "Repeat: Off", 'all': "Repeat: All", 'one': "Repeat: One"}
+
+CODEC_NAMES = {
+    'avc1': 'h264', 'avc3': 'h264', 'hvc1': 'hevc', 'hev1': 'hevc', 'av01': 'av1', 'vp09': 'vp9',
+    'mp4v': 'mpeg4', 'mp4a': 'aac', 'ac-3': 'ac3', 'ec-3': 'eac3', 'Opus': 'opus', 'fLaC': 'flac', '.mp3': 'mp3',
+}
+
+
+def normalize_title(text):
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def title_from_path(path):
+    return ' '.join(re.split(r'[\s._]+', os.path.splitext(os.path.basename(path))[0])).strip()
+
+
+def read_boxes(file, start, end):
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack('>I4s', header)
+        offset = 8
+        if size == 1:
+            size = struct.unpack('>Q', file.read(8))[0]
+            offset = 16
+        elif size == 0:
+            size = end - position
+        if size < offset:
+            return
+        yield kind, position + offset, position + size
+        position += size
+
+
+def probe_mp4(path):
+    # ISO BMFF (mp4/m4v/mov/m4a): only box headers are read, so moov at the end of the file is cheap too
+    info = {}
+    with open(path, 'rb') as file:
+        end = os.fstat(file.fileno()).st_size
+        for kind, start, stop in read_boxes(file, 0, end):
+            if kind == b'moov':
+                parse_moov(file, start, stop, info)
+                break
+    return info
+
+
+def parse_moov(file, start, stop, info):
+    for kind, box_start, box_stop in read_boxes(file, start, stop):
+        if kind == b'mvhd':
+            file.seek(box_start)
+            version = file.read(1)[0]
+            file.seek(box_start + (20 if version == 1 else 12))
+            if version == 1:
+                timescale, duration = struct.unpack('>IQ', file.read(12))
+            else:
+                timescale, duration = struct.unpack('>II', file.read(8))
+            if timescale:
+                info['duration'] = duration / timescale
+        elif kind == b'trak':
+            parse_track(file, box_start, box_stop, info)
+
+
+def parse_track(file, start, stop, info):
+    handler = codec = None
+    width = height = 0
+    for kind, box_start, box_stop in read_boxes(file, start, stop):
+        if kind == b'tkhd':
+            # Width and height are the last two 16.16 fixed-point fields of tkhd
+            file.seek(box_stop - 8)
+            width, height = (value >> 16 for value in struct.unpack('>II', file.read(8)))
+        elif kind == b'mdia':
+            for mdia_kind, mdia_start, mdia_stop in read_boxes(file, box_start, box_stop):
+                if mdia_kind == b'hdlr':
+                    file.seek(mdia_start + 8)
+                    handler = file.read(4)
+                elif mdia_kind == b'minf':
+                    codec = find_sample_format(file, mdia_start, mdia_stop)
+    if handler == b'vide' and 'video_codec' not in info:
+        info['video_codec'] = codec
+        info['width'], info['height'] = width, height
+    elif handler == b'soun' and 'audio_codec' not in info:
+        info['audio_codec'] = codec
+
+
+def find_sample_format(file, start, stop):
+    for kind, box_start, box_stop in read_boxes(file, start, stop):
+        if kind == b'stbl':
+            for stbl_kind, stbl_start, _ in read_boxes(file, box_start, box_stop):
+                if stbl_kind == b'stsd':
+                    # version/flags, entry count, then the first sample entry: size and format
+                    file.seek(stbl_start + 12)
+                    fourcc = file.read(4).decode('latin-1')
+                    return CODEC_NAMES.get(fourcc, fourcc.strip())
+    return None
+
+
+def probe_ffprobe(path):
+    # Optional: other containers are described by ffprobe when it is installed
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return {}
+    try:
+        result = subprocess.run([ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+                                capture_output=True, timeout=15, check=True)
+        data = json.loads(result.stdout)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return {}
+    info = {}
+    fmt = data.get('format', {})
+    if fmt.get('duration'):
+        info['duration'] = float(fmt['duration'])
+    if fmt.get('tags', {}).get('title'):
+        info['title'] = fmt['tags']['title']
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'video' and 'video_codec' not in info:
+            info['video_codec'] = stream.get('codec_name')
+            info['width'], info['height'] = stream.get('width', 0), stream.get('height', 0)
+        elif stream.get('codec_type') == 'audio' and 'audio_codec' not in info:
+            info['audio_codec'] = stream.get('codec_name')
+    return info
+
+
+def probe_media(path):
+    try:
+        if path.lower().endswith(('.mp4', '.m4v', '.mov', '.m4a')):
+            info = probe_mp4(path)
+        else:
+            info = probe_ffprobe(path)
+    except (OSError, struct.error, IndexError, ValueError):
+        info = {}
+    info.setdefault('title', title_from_path(path))
+    return info
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+
+def query_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2) if ' ' not in text[i:i + 3]}
+
+
+def has_word_prefixes(title, prefixes):
+    title_words = title.split()
+    return all(any(word.startswith(prefix) for word in title_words) for prefix in prefixes)
+
+
+def fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+class MediaLibrary:
+    def __init__(self, path=LIBRARY_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        # The crawler writes from its own thread, so every thread gets its own connection (WAL)
+        self.local = threading.local()
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                title_key TEXT NOT NULL,
+                duration REAL,
+                width INTEGER,
+                height INTEGER,
+                video_codec TEXT,
+                audio_codec TEXT
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS media_title_key ON media (title_key)")
+        # rowid of media_fts and media_words matches media.id. media_words holds whole words with
+        # prefix indexes, so words of one or two letters match as prefixes of any title word
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5(title, tokenize = 'trigram')")
+        self.db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS media_words
+            USING fts5(title, tokenize = 'unicode61 remove_diacritics 0', prefix = '1 2')
+        """)
+        if self.db.execute("SELECT NOT EXISTS (SELECT 1 FROM media_words) AND EXISTS (SELECT 1 FROM media)").fetchone()[0]:
+            self.db.execute("INSERT INTO media_words (rowid, title) SELECT id, title_key FROM media")
+        self.db.execute("CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode = WAL")
+            self.local.db = db
+        return db
+
+    def folders(self):
+        return [path for (path,) in self.db.execute("SELECT path FROM folders")]
+
+    def add_folder(self, path):
+        self.db.execute("INSERT OR IGNORE INTO folders (path) VALUES (?)", (path,))
+        self.db.commit()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+
+    def snapshot(self):
+        return {path: (size, mtime) for path, size, mtime in self.db.execute("SELECT path, size, mtime FROM media")}
+
+    def upsert(self, path, size, mtime, info):
+        db = self.db
+        title = info['title']
+        row = db.execute("SELECT id FROM media WHERE path = ?", (path,)).fetchone()
+        values = (size, mtime, title, normalize_title(title), info.get('duration'), info.get('width'), info.get('height'),
+                  info.get('video_codec'), info.get('audio_codec'))
+        if row is None:
+            media_id = db.execute("""
+                INSERT INTO media (size, mtime, title, title_key, duration, width, height, video_codec, audio_codec, path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, values + (path,)).lastrowid
+        else:
+            media_id = row[0]
+            db.execute("""
+                UPDATE media SET size = ?, mtime = ?, title = ?, title_key = ?, duration = ?, width = ?, height = ?,
+                    video_codec = ?, audio_codec = ? WHERE id = ?
+            """, values + (media_id,))
+            db.execute("DELETE FROM media_fts WHERE rowid = ?", (media_id,))
+            db.execute("DELETE FROM media_words WHERE rowid = ?", (media_id,))
+        db.execute("INSERT INTO media_fts (rowid, title) VALUES (?, ?)", (media_id, normalize_title(title)))
+        db.execute("INSERT INTO media_words (rowid, title) VALUES (?, ?)", (media_id, normalize_title(title)))
+
+    def remove(self, paths):
+        db = self.db
+        for path in paths:
+            row = db.execute("SELECT id FROM media WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                db.execute("DELETE FROM media_fts WHERE rowid = ?", row)
+                db.execute("DELETE FROM media_words WHERE rowid = ?", row)
+                db.execute("DELETE FROM media WHERE id = ?", row)
+
+    def commit(self):
+        self.db.commit()
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        query = normalize_title(text)
+        if not query:
+            return []
+        words = query.split()
+        long_words = [word for word in words if len(word) >= 3]
+        short_words = [word for word in words if len(word) < 3]
+        columns = "m.path, m.title, m.duration, m.width, m.height, m.video_codec, m.audio_codec"
+        if not long_words:
+            prefixes = ' AND '.join(fts_phrase(word) + '*' for word in short_words)
+            # Only short words typed so far: titles starting with the query come first (title index),
+            # then titles where every word is a prefix of some title word
+            results = self.db.execute(f"""
+                SELECT {columns} FROM media m WHERE m.title_key >= ? AND m.title_key < ?
+                ORDER BY m.title_key LIMIT ?
+            """, (query, query + '\uffff', limit)).fetchall()
+            if len(results) < limit:
+                found = {row[0] for row in results}
+                rows = self.db.execute(f"""
+                    SELECT {columns} FROM media_words w JOIN media m ON m.id = w.rowid
+                    WHERE media_words MATCH ? LIMIT ?
+                """, (prefixes, limit * 2)).fetchall()
+                results += [row for row in rows if row[0] not in found][:limit - len(results)]
+            return results
+        # Every word of 3+ letters as a substring (trigram phrase); short words are checked as word
+        # prefixes on the best candidates (joining the prefix index would expand huge posting lists)
+        rows = self.db.execute(f"""
+            SELECT {columns}, f.title FROM media_fts f JOIN media m ON m.id = f.rowid
+            WHERE media_fts MATCH ? ORDER BY rank LIMIT ?
+        """, (' AND '.join(fts_phrase(word) for word in long_words), limit * SHORT_WORD_CANDIDATES)).fetchall()
+        results = [row[:-1] for row in rows if has_word_prefixes(row[-1], short_words)][:limit]
+        if len(results) < limit:
+            results += self.fuzzy_search(query, limit - len(results), {row[0] for row in results})
+        return results
+
+    def fuzzy_search(self, query, limit, exclude):
+        # Typos: any shared trigram makes a candidate, candidates are ranked by trigram overlap
+        trigrams = query_trigrams(query)
+        if not trigrams:
+            return []
+        rows = self.db.execute("""
+            SELECT m.path, m.title, m.duration, m.width, m.height, m.video_codec, m.audio_codec, f.title
+            FROM media_fts f JOIN media m ON m.id = f.rowid
+            WHERE media_fts MATCH ? ORDER BY rank LIMIT ?
+        """, (' OR '.join(fts_phrase(trigram) for trigram in trigrams), limit * 8)).fetchall()
+        scored = []
+        for row in rows:
+            if row[0] in exclude:
+                continue
+            shared = len(trigrams & query_trigrams(row[-1]))
+            if shared * 2 >= len(trigrams):
+                scored.append((-shared, row[1], row[:-1]))
+        scored.sort()
+        return [row for _, _, row in scored[:limit]]
+
+
+class Playlist:
+    def __init__(self):
+        self.items = []
+        # Play order as indices into items; shuffling only permutes this list
+        self.order = []
+        self.position = -1
+        self.shuffle = False
+        self.repeat = 'off'
+
+    def add(self, paths):
+        # Returns the queue position of the first added item; when shuffled, the added items
+        # form a shuffled block at the end of the queue and all of them follow that position
+        position = len(self.order)
+        start = len(self.items)
+        self.items.extend(paths)
+        added = list(range(start, len(self.items)))
+        if self.shuffle:
+            random.shuffle(added)
+        self.order.extend(added)
+        return position
+
+    def current(self):
+        if 0 <= self.position < len(self.order):
+            return self.items[self.order[self.position]]
+        return None
+
+    def next_position(self, position, auto=False):
+        # Repeat one only replays when a track ends on its own, Next still moves through the queue
+        if not self.order:
+            return None
+        if auto and self.repeat == 'one' and position >= 0:
+            return position
+        if position + 1 < len(self.order):
+            return position + 1
+        if self.repeat == 'all':
+            return 0
+        return None
+
+    def peek_next(self, skip=()):
+        # What the end of the current track will play, passing over paths in skip
+        position = self.position
+        for _ in range(len(self.order)):
+            position = self.next_position(position, auto=True)
+            if position is None:
+                return None
+            path = self.items[self.order[position]]
+            if path not in skip:
+                return path
+        return None
+
+    def advance(self, auto=False):
+        position = self.next_position(self.position, auto)
+        if position is None:
+            return None
+        self.position = position
+        return self.current()
+
+    def back(self):
+        if self.position > 0:
+            self.position -= 1
+        elif self.repeat == 'all' and self.order:
+            self.position = len(self.order) - 1
+        else:
+            return None
+        return self.current()
+
+    def seek(self, position):
+        self.position = position
+        return self.current()
+
+    def set_shuffle(self, enabled):
+        self.shuffle = enabled
+        current = self.order[self.position] if self.position >= 0 else None
+        if enabled:
+            # The current item stays first, the rest of the queue is reshuffled after it
+            rest = [index for index in self.order if index != current]
+            random.shuffle(rest)
+            self.order = ([] if current is None else [current]) + rest
+            self.position = 0 if current is not None else -1
+        else:
+            self.order = list(range(len(self.items)))
+            self.position = -1 if current is None else current
+
+    def cycle_repeat(self):
+        modes = list(REPEAT_LABELS)
+        self.repeat = modes[(modes.index(self.repeat) + 1) % len(modes)]
+        return self.repeat
+
+
+class LibraryIndexer(QObject):
+    progress = pyqtSignal(int)
+    changed = pyqtSignal()
+    finished = pyqtSignal(int)
+
+    def __init__(self, library, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.thread = None
+        self.cancelled = threading.Event()
+        self.rescan = threading.Event()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            # A folder added mid-scan is picked up by one more pass
+            self.rescan.set()
+            return
+        self.cancelled.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.cancelled.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        self.scan()
+        while self.rescan.is_set() and not self.cancelled.is_set():
+            self.rescan.clear()
+            self.scan()
+
+    def scan(self):
+        library = self.library
+        known = library.snapshot()
+        seen = set()
+        pending = 0
+        for root in library.folders():
+            for directory, _, files in os.walk(root):
+                if self.cancelled.is_set():
+                    library.commit()
+                    return
+                for name in files:
+                    if not name.lower().endswith(MEDIA_EXTENSIONS):
+                        continue
+                    # Probing is the slow part, so a large directory must not delay shutdown
+                    if self.cancelled.is_set():
+                        library.commit()
+                        return
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    seen.add(path)
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                    # Unchanged files keep their stored metadata, only new or modified ones are probed
+                    if known.get(path) == signature:
+                        continue
+                    library.upsert(path, stat.st_size, stat.st_mtime_ns, probe_media(path))
+                    pending += 1
+                    if pending % LIBRARY_BATCH_SIZE == 0:
+                        library.commit()
+                        self.progress.emit(len(seen))
+                        self.changed.emit()
+        removed = [path for path in known if path not in seen]
+        library.remove(removed)
+        library.commit()
+        if pending or removed:
+            self.changed.emit()
+        self.finished.emit(len(seen))
+
+
 class VideoPlayer(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -30,7 +518,8 @@ class VideoPlayer(QMainWindow):
             shadow.setOffset(0, 0)
             widget.setGraphicsEffect(shadow)
         
-        # Video player setup
+        # Video player setup: the active pair plays, the standby pair preloads the next queue item
+        # and the two are swapped when the current item ends, so there is no loading stall in between
         self.media_player = QMediaPlayer()
         self.video_widget = QVideoWidget()
         self.media_player.setVideoOutput(self.video_widget)
@@ -39,6 +528,18 @@ class VideoPlayer(QMainWindow):
         self.audio_output = QAudioOutput()
         self.media_player.setAudioOutput(self.audio_output)
         
+        self.standby_player = QMediaPlayer()
+        self.standby_output = QAudioOutput()
+        self.standby_player.setAudioOutput(self.standby_output)
+        self.preloaded = None
+        self.broken = set()
+        self.playlist = Playlist()
+        
+        for player in (self.media_player, self.standby_player):
+            player.positionChanged.connect(self.update_position)
+            player.durationChanged.connect(self.update_duration)
+            player.mediaStatusChanged.connect(self.media_status_changed)
+        
         # Control buttons
         self.play_button = QPushButton("Play")
         self.play_button.clicked.connect(self.play_video)
@@ -52,16 +553,35 @@ class VideoPlayer(QMainWindow):
         self.open_button = QPushButton("Open Video")
         self.open_button.clicked.connect(self.open_file)
         
+        self.folder_button = QPushButton("Add Folder")
+        self.folder_button.clicked.connect(self.add_library_folder)
+        
+        self.previous_button = QPushButton("Previous")
+        self.previous_button.clicked.connect(self.play_previous)
+        
+        self.next_button = QPushButton("Next")
+        self.next_button.clicked.connect(self.play_next)
+        
+        self.shuffle_button = QPushButton("Shuffle")
+        self.shuffle_button.setCheckable(True)
+        self.shuffle_button.toggled.connect(self.set_shuffle)
+        
+        self.repeat_button = QPushButton(REPEAT_LABELS['off'])
+        self.repeat_button.clicked.connect(self.cycle_repeat)
+        
         apply_glassmorphism(self.play_button)
         apply_glassmorphism(self.pause_button)
         apply_glassmorphism(self.stop_button)
         apply_glassmorphism(self.open_button)
+        apply_glassmorphism(self.folder_button)
+        apply_glassmorphism(self.previous_button)
+        apply_glassmorphism(self.next_button)
+        apply_glassmorphism(self.shuffle_button)
+        apply_glassmorphism(self.repeat_button)
         
         # Slider for video position
         self.position_slider = QSlider(Qt.Orientation.Horizontal)
         self.position_slider.sliderMoved.connect(self.set_position)
-        self.media_player.positionChanged.connect(self.update_position)
-        self.media_player.durationChanged.connect(self.update_duration)
         
         apply_glassmorphism(self.position_slider)
         
@@ -73,12 +593,36 @@ class VideoPlayer(QMainWindow):
         
         apply_glassmorphism(self.volume_slider)
         
-        # Search bar for YouTube
+        # Media library index, crawled in the background
+        self.library = MediaLibrary()
+        if not self.library.folders():
+            movies = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.MoviesLocation)
+            if movies and os.path.isdir(movies):
+                self.library.add_folder(movies)
+        self.indexer = LibraryIndexer(self.library, self)
+        self.indexer.changed.connect(self.refresh_results)
+        self.indexer.finished.connect(self.update_library_count)
+        self.rescan_timer = QTimer(self)
+        self.rescan_timer.setInterval(LIBRARY_RESCAN_MS)
+        self.rescan_timer.timeout.connect(self.indexer.start)
+        
+        # Search bar over the library, results update as the user types
         self.search_bar = QLineEdit()
-        self.search_bar.setPlaceholderText("Search YouTube...")
         self.search_bar.returnPressed.connect(self.search_video)
+        self.search_bar.textChanged.connect(self.schedule_search)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(30)
+        self.search_timer.timeout.connect(self.refresh_search)
+        
+        self.results_list = QListWidget()
+        self.results_list.setMaximumHeight(220)
+        self.results_list.itemActivated.connect(self.play_result)
+        self.results_list.hide()
         
         apply_glassmorphism(self.search_bar)
+        apply_glassmorphism(self.results_list)
+        self.update_library_count()
         
         # Layout setup
         control_layout = QHBoxLayout()
@@ -86,6 +630,13 @@ class VideoPlayer(QMainWindow):
         control_layout.addWidget(self.pause_button)
         control_layout.addWidget(self.stop_button)
         control_layout.addWidget(self.open_button)
+        control_layout.addWidget(self.folder_button)
+        
+        playlist_layout = QHBoxLayout()
+        playlist_layout.addWidget(self.previous_button)
+        playlist_layout.addWidget(self.next_button)
+        playlist_layout.addWidget(self.shuffle_button)
+        playlist_layout.addWidget(self.repeat_button)
         
         volume_layout = QHBoxLayout()
         volume_layout.addWidget(QLabel("Volume"))
@@ -93,9 +644,11 @@ class VideoPlayer(QMainWindow):
         
         layout = QVBoxLayout()
         layout.addWidget(self.search_bar)
+        layout.addWidget(self.results_list)
         layout.addWidget(self.video_widget)
         layout.addWidget(self.position_slider)
         layout.addLayout(control_layout)
+        layout.addLayout(playlist_layout)
         layout.addLayout(volume_layout)
         
         container = QWidget()
@@ -103,6 +656,9 @@ class VideoPlayer(QMainWindow):
         
         self.setCentralWidget(container)
         
+        self.indexer.start()
+        self.rescan_timer.start()
+        
     def play_video(self):
         self.media_player.play()
         
@@ -116,25 +672,158 @@ class VideoPlayer(QMainWindow):
         self.media_player.setPosition(position)
         
     def update_position(self, position):
+        # The standby player reports its preloaded item, which is not on screen
+        if self.sender() is self.standby_player:
+            return
         self.position_slider.setValue(position)
         
     def update_duration(self, duration):
+        if self.sender() is self.standby_player:
+            return
         self.position_slider.setRange(0, duration)
         
     def set_volume(self, volume):
         self.audio_output.setVolume(volume / 100)  # Преобразуем обратно в float
+        self.standby_output.setVolume(volume / 100)
+        
+    def media_status_changed(self, status):
+        if self.sender() is self.standby_player:
+            if status == QMediaPlayer.MediaStatus.InvalidMedia:
+                self.broken.add(self.preloaded)
+                self.preloaded = None
+            return
+        if status == QMediaPlayer.MediaStatus.LoadedMedia:
+            self.preload_next()
+        elif status == QMediaPlayer.MediaStatus.EndOfMedia:
+            self.play_next(auto=True)
+        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
+            self.broken.add(self.playlist.current())
+            self.play_next()
+        
+    def preload_next(self):
+        path = self.playlist.peek_next(skip=self.broken)
+        if path == self.preloaded:
+            return
+        self.preloaded = path
+        self.standby_player.setSource(QUrl.fromLocalFile(path) if path else QUrl())
+        if path:
+            # Pausing right away opens the decoders and stops at the first frame, ready to start instantly
+            self.standby_player.pause()
+        
+    def swap_players(self):
+        previous = self.media_player
+        previous.setVideoOutput(None)
+        self.media_player, self.standby_player = self.standby_player, previous
+        self.audio_output, self.standby_output = self.standby_output, self.audio_output
+        self.media_player.setVideoOutput(self.video_widget)
+        self.media_player.play()
+        previous.stop()
+        self.preloaded = None
+        # Not through update_duration: inside the EndOfMedia slot sender() is still the old player,
+        # now the standby one, and the new player will not report its duration again
+        self.position_slider.setRange(0, self.media_player.duration())
+        # The new active player is already loaded and will not report it again
+        self.preload_next()
+        
+    def start_current(self):
+        path = self.playlist.current()
+        if path is None:
+            return
+        if path == self.preloaded:
+            self.swap_players()
+        else:
+            self.media_player.setSource(QUrl.fromLocalFile(path))
+            self.play_video()
+        self.setWindowTitle(os.path.basename(path))
+        
+    def play_next(self, *, auto=False):
+        # Items that already failed to load are skipped without another attempt
+        for _ in range(len(self.playlist.order)):
+            path = self.playlist.advance(auto)
+            if path is None:
+                return
+            if path not in self.broken:
+                self.start_current()
+                return
+        
+    def play_previous(self):
+        if self.media_player.position() > RESTART_THRESHOLD_MS or self.playlist.back() is None:
+            self.media_player.setPosition(0)
+            return
+        self.start_current()
+        
+    def set_shuffle(self, enabled):
+        self.playlist.set_shuffle(enabled)
+        self.preload_next()
+        
+    def cycle_repeat(self):
+        self.repeat_button.setText(REPEAT_LABELS[self.playlist.cycle_repeat()])
+        self.preload_next()
+        
+    def enqueue(self, paths, play):
+        self.broken.difference_update(paths)
+        start = self.playlist.add(paths)
+        if play or self.playlist.current() is None:
+            self.playlist.seek(start)
+            self.start_current()
+        else:
+            self.preload_next()
         
     def search_video(self):
-        search_text = self.search_bar.text()
-        # Implement YouTube search logic here
-        print(f"Searching for: {search_text}")
+        # Enter plays the selected result, or the best one
+        self.search_timer.stop()
+        self.refresh_search()
+        item = self.results_list.currentItem() or self.results_list.item(0)
+        if item is not None:
+            self.play_result(item)
+        
+    def schedule_search(self):
+        self.search_timer.start()
+        
+    def refresh_search(self):
+        results = self.library.search(self.search_bar.text())
+        self.results_list.clear()
+        for path, title, duration, width, height, video_codec, audio_codec in results:
+            details = [format_duration(duration)] if duration else []
+            if width and height:
+                details.append(f"{width}×{height}")
+            codecs = '/'.join(codec for codec in (video_codec, audio_codec) if codec)
+            if codecs:
+                details.append(codecs)
+            item = QListWidgetItem(' · '.join([title] + details))
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            item.setToolTip(path)
+            self.results_list.addItem(item)
+        self.results_list.setVisible(bool(results))
+        
+    def refresh_results(self):
+        # Index updates only refresh results that are on screen, a dismissed list stays hidden
+        if not self.results_list.isHidden():
+            self.refresh_search()
+        
+    def play_result(self, item):
+        self.results_list.hide()
+        self.enqueue([item.data(Qt.ItemDataRole.UserRole)], play=True)
+        
+    def update_library_count(self):
+        self.search_bar.setPlaceholderText(f"Search library ({self.library.count()} files)...")
+        
+    def add_library_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Add Folder")
+        if folder:
+            self.library.add_folder(folder)
+            self.indexer.start()
+        
+    def closeEvent(self, event):
+        self.indexer.stop()
+        super().closeEvent(event)
         
     def open_file(self):
+        # Several files can be picked at once, they are queued after the current item
         file_dialog = QFileDialog()
-        file_path, _ = file_dialog.getOpenFileName(self, "Open Video")
-        if file_path:
-            self.media_player.setSource(QUrl.fromLocalFile(file_path))
-            self.play_video()
+        file_paths, _ = file_dialog.getOpenFileNames(self, "Open Video")
+        if file_paths:
+            self.enqueue(file_paths, play=self.media_player.playbackState() == QMediaPlayer.PlaybackState.StoppedState)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)